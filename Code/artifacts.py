@@ -0,0 +1,124 @@
+"""
+Persisted model artifacts.
+
+Each fitted station is saved in Data/Model as two small files:
+
+    <station>_model.npz   coefficients and intercept
+    <station>_model.json  feature schema and metadata
+
+The JSON schema lists the design-matrix columns in order (see
+features.design_columns), the station's event columns, the fit options and the
+training period. The features are used unscaled, so there is no scaling
+metadata to apply at prediction time ('scaling' is null). FORMAT_VERSION is
+increased when the layout of the files changes, and model_version counts the
+saves of a station.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+
+# Set the data folder path (update the path as needed)
+DATA_FOLDER = PATH + r'\Data'
+MODEL_FOLDER = DATA_FOLDER + r'\Model'
+
+FORMAT_VERSION = 1
+
+
+class Model:
+    """
+    Coefficients and schema of a fitted station
+    """
+
+    def __init__(self, place, columns, coef, intercept, events, meta):
+        self.place = place
+        self.columns = columns
+        self.coef = coef
+        self.intercept = intercept
+        self.events = events
+        self.meta = meta
+
+    def as_dict(self):
+        # Same keys as the results of batch.fit_stations (see event_impact.py)
+        return {'columns': self.columns, 'coef': self.coef, 'intercept': self.intercept}
+
+
+def model_paths(place, folder=None):
+    folder = folder or MODEL_FOLDER
+    return (os.path.join(folder, f'{place}_model.npz'),
+            os.path.join(folder, f'{place}_model.json'))
+
+
+def json_value(value):
+    # Dates as YYYY-MM-DD and numpy scalars as plain numbers
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).strftime('%Y-%m-%d')
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def save_model(place, columns, coef, intercept, events, meta=None, folder=None):
+    """
+    Save the fitted model of a station. meta holds extra fields for the schema,
+    e.g. fit_intercept, n_rows and the first and last training date.
+    """
+    os.makedirs(folder or MODEL_FOLDER, exist_ok=True)
+    npz_path, json_path = model_paths(place, folder)
+
+    previous = 0
+    if os.path.exists(json_path):
+        with open(json_path, 'r') as f:
+            previous = json.load(f).get('model_version', 0)
+
+    np.savez(npz_path, coef=np.asarray(coef, dtype=float), intercept=float(intercept))
+    schema = {
+        'format_version': FORMAT_VERSION,
+        'model_version': previous + 1,
+        'station': place,
+        'created': pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'columns': list(columns),
+        'events': list(events),
+        'scaling': None,
+        **{key: json_value(value) for key, value in (meta or {}).items()},
+    }
+    with open(json_path, 'w') as f:
+        json.dump(schema, f, indent=2)
+
+    _MODELS.pop((folder or MODEL_FOLDER, place), None)
+
+
+_MODELS = {}
+
+
+def load_model(place, folder=None):
+    """
+    Model of a station, read from disk on first use and kept in memory after
+    """
+    key = (folder or MODEL_FOLDER, place)
+    if key not in _MODELS:
+        npz_path, json_path = model_paths(place, folder)
+        if not os.path.exists(json_path):
+            raise FileNotFoundError(f'No saved model for {place}, run final_script first')
+
+        with open(json_path, 'r') as f:
+            schema = json.load(f)
+        if schema['format_version'] > FORMAT_VERSION:
+            raise ValueError(f'The model of {place} was saved by a newer version (format {schema["format_version"]})')
+
+        with np.load(npz_path) as arrays:
+            coef, intercept = arrays['coef'], float(arrays['intercept'])
+        _MODELS[key] = Model(place, schema['columns'], coef, intercept, schema['events'], schema)
+
+    return _MODELS[key]
+
+
+def saved_stations(folder=None):
+    folder = folder or MODEL_FOLDER
+    if not os.path.exists(folder):
+        return []
+    return sorted(file.split('_model.json')[0] for file in os.listdir(folder) if file.endswith('_model.json'))
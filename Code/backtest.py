@@ -0,0 +1,221 @@
+"""
+Rolling-origin backtest of the station regression.
+
+For a series of cutoff dates, the model is trained on the data up to the
+cutoff and predicts the next `horizon` days, which it has not seen. The cutoffs
+are `step` days apart, starting `initial` days after the first date. With
+window=None the training window expands (every date up to the cutoff).
+Otherwise it rolls and holds the last `window` days, which must be a multiple of step.
+
+The design matrix of a station is built once. The rows are split into blocks
+of `step` days, and the X'X / X'y statistics of each block are computed once.
+The training statistics at a cutoff are the previous ones plus the newest
+block (and minus the block that left a rolling window), so each cutoff costs
+one solve of the normal equations instead of a refit (see solver.py).
+
+Each test date is labelled 'event' if one of the station's event columns is
+nonzero on it, 'near_event' if an event is at most `around` days away, and
+'other' otherwise. The summary reports the out-of-sample error of each label:
+
+    Output/backtest_errors.parquet   one row per station, cutoff and test date
+    Output/backtest_summary.csv      MAE, RMSE, MAPE and bias per station and label
+"""
+
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import features
+import solver
+import telemetry
+
+PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+
+# Set the output folder path (update the path as needed)
+OUTPUT_FOLDER = PATH + r'\Output'
+
+INITIAL = 365  # days of data before the first cutoff
+STEP = 28  # days between cutoffs
+HORIZON = 28  # days predicted after each cutoff
+AROUND = 1  # days before and after an event counted as near the event
+
+
+def block_edges(dates, initial=INITIAL, step=STEP):
+    """
+    Last date of each block of step days, and the index of the first edge that is a cutoff
+    """
+    first, last = dates.min(), dates.max()
+    edges = pd.date_range(first + pd.Timedelta(days=step - 1), last, freq=f'{step}D')
+    first_cutoff = np.searchsorted(edges, first + pd.Timedelta(days=initial - 1))
+    return edges, first_cutoff
+
+
+def event_labels(dates, event_values, around=AROUND):
+    """
+    'event', 'near_event' or 'other' for each date
+    """
+    days = (pd.DatetimeIndex(dates) - pd.Timestamp('1970-01-01')).days.to_numpy()
+    event_days = np.unique(days[(event_values != 0).any(axis=1)]) if event_values.shape[1] else np.empty(0, dtype=int)
+    labels = np.full(len(days), 'other', dtype=object)
+    if len(event_days):
+        position = np.clip(np.searchsorted(event_days, days), 1, len(event_days)) - 1
+        distance = np.minimum(np.abs(days - event_days[position]),
+                              np.abs(days - event_days[np.minimum(position + 1, len(event_days) - 1)]))
+        labels[distance <= around] = 'near_event'
+        labels[distance == 0] = 'event'
+    return labels
+
+
+def check_window(window, step):
+    # A rolling window is made of whole blocks
+    if window is not None and window % step:
+        raise ValueError(f'window ({window} days) must be a multiple of step ({step} days)')
+
+
+def backtest_station(data, place, event_lst, initial=INITIAL, step=STEP, horizon=HORIZON, window=None,
+                     around=AROUND, fit_intercept=True):
+    """
+    Backtest one station on its clean frame (see final_script.get_clean_data).
+    Returns the errors of every test date as a dataframe.
+    """
+    check_window(window, step)
+
+    data = data.copy()
+    data['date'] = pd.to_datetime(data['date'])
+    data = data.fillna(0).sort_values('date').reset_index(drop=True)
+    dates = pd.DatetimeIndex(data['date'])
+    y = data['ridership'].to_numpy(dtype=float)
+
+    X, _ = features.build_design_matrix(data, event_lst)
+    labels = event_labels(dates, data[event_lst].to_numpy(dtype=float), around)
+
+    edges, first_cutoff = block_edges(dates, initial, step)
+    bounds = np.searchsorted(dates, edges, side='right')
+    starts = np.concatenate([[0], bounds[:-1]])
+
+    # Statistics of every block, computed once
+    blocks = [solver.NormalEquations.from_data(X[start:stop], y[start:stop]) for start, stop in zip(starts, bounds)]
+    window_blocks = window // step if window is not None else None
+
+    errors = []
+    train = None
+    for k, (edge, stop) in enumerate(zip(edges, bounds)):
+        # Add the newest block and drop the one that left the rolling window
+        train = blocks[k] if train is None else train + blocks[k]
+        if window_blocks is not None and k >= window_blocks:
+            train = train - blocks[k - window_blocks]
+        if k < first_cutoff:
+            continue
+
+        test = slice(stop, np.searchsorted(dates, edge + pd.Timedelta(days=horizon), side='right'))
+        if test.stop <= test.start:
+            continue
+
+        coef, intercept = train.solve(fit_intercept)
+        predicted = X[test] @ coef + intercept
+        errors.append(pd.DataFrame({
+            'station': place,
+            'cutoff': edge,
+            'date': dates[test],
+            'days_ahead': (dates[test] - edge).days,
+            'label': labels[test],
+            'actual': y[test],
+            'predicted': predicted,
+            'train_rows': train.n,
+        }))
+
+    if not errors:
+        return pd.DataFrame(columns=['station', 'cutoff', 'date', 'days_ahead', 'label', 'actual', 'predicted',
+                                     'train_rows', 'error'])
+    errors = pd.concat(errors, ignore_index=True)
+    errors['error'] = errors['predicted'] - errors['actual']
+    return errors
+
+
+def summarize(errors):
+    """
+    Out-of-sample MAE, RMSE, MAPE (%) and bias per station and label, and over all labels
+    """
+    errors = errors.assign(abs_error=errors['error'].abs(), squared_error=errors['error'] ** 2,
+                           pct_error=(errors['error'] / errors['actual'].where(errors['actual'] != 0)).abs() * 100)
+    every_label = errors.assign(label='all')
+    grouped = pd.concat([errors, every_label]).groupby(['station', 'label'])
+    summary = pd.DataFrame({
+        'n': grouped.size(),
+        'mae': grouped['abs_error'].mean(),
+        'rmse': np.sqrt(grouped['squared_error'].mean()),
+        'mape': grouped['pct_error'].mean(),
+        'bias': grouped['error'].mean(),
+        'cutoffs': grouped['cutoff'].nunique(),
+    })
+    return summary.reset_index()
+
+
+def run_station(place, data, event_lst, options):
+    try:
+        with telemetry.stage('backtest', place) as stage:
+            errors = backtest_station(data, place, event_lst, **options)
+            stage.set(rows=len(errors), cutoffs=errors['cutoff'].nunique())
+        return errors
+    except Exception as e:
+        traceback.print_exc()
+        print(f'Backtest of {place} failed: {e!r}')
+        return None
+
+
+def backtest(datas, event_list, n_jobs=1, save=True, **options):
+    """
+    Backtest every station of datas (place -> clean frame). options are passed to
+    backtest_station (initial, step, horizon, window, around, fit_intercept).
+    Returns (errors, summary).
+    """
+    check_window(options.get('window'), options.get('step', STEP))
+    time0 = time.perf_counter()
+    places = list(datas)
+    if n_jobs == 1:
+        results = [run_station(place, datas[place], event_list[place], options) for place in places]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(run_station, places, [datas[place] for place in places],
+                                        [event_list[place] for place in places], [options] * len(places)))
+
+    errors = [result for result in results if result is not None and len(result)]
+    if not errors:
+        print('No station could be backtested')
+        return None, None
+    errors = pd.concat(errors, ignore_index=True)
+    summary = summarize(errors)
+
+    if save:
+        errors['station'] = errors['station'].astype('category')
+        errors['label'] = errors['label'].astype('category')
+        errors.to_parquet(OUTPUT_FOLDER + '\\' + 'backtest_errors.parquet', index=False)
+        summary.to_csv(OUTPUT_FOLDER + '\\' + 'backtest_summary.csv', index=False)
+
+    print(summary[summary['label'] != 'all'].round(2).to_string(index=False))
+    print(f'Backtested {errors["station"].nunique()} stations over {errors["cutoff"].nunique()} cutoffs '
+          f'in {time.perf_counter() - time0:.1f} seconds')
+
+    return errors, summary
+
+
+def backtest_stations(stations=None, n_jobs=1, **options):
+    """
+    Clean and backtest every station in Data/Raw (or stations), see backtest().
+    """
+    import final_script
+    check_window(options.get('window'), options.get('step', STEP))
+    with telemetry.run('backtest', stations=stations):
+        shared = final_script.load_shared_inputs()
+        datas = {}
+        for file in final_script.raw_files(stations):
+            place = file.split('.csv')[0]
+            with telemetry.stage('clean', place) as stage:
+                datas[place] = final_script.get_clean_data(final_script.DATA_FOLDER + '\\' + 'Raw\\' + file, place, shared)
+                stage.set(rows=len(datas[place]))
+
+        return backtest(datas, shared.event_list, n_jobs=n_jobs, **options)
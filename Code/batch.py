@@ -0,0 +1,95 @@
+"""
+Batched multi-station regression.
+
+Every station shares the same date index and the same calendar and weather
+features; only the target ridership and the event columns differ. The design
+matrix is built once, with the event columns of every station, and X'X and X'Y
+are computed for all stations together as one multi-target least-squares
+problem. Each station's statistics are then a block of the shared ones: its own
+event columns are selected out of X'X and X'Y. Cross-validation folds are shared
+the same way, so a full-network refit is a handful of matrix products.
+
+Stations with missing dates do not fit the shared fold layout; their
+statistics are computed from their own rows of the shared design matrix.
+"""
+
+import numpy as np
+import pandas as pd
+
+import features
+import solver
+
+
+def build_shared_design(dates, shared, events):
+    """
+    Design matrix of the calendar, weather and given event columns on a date index.
+    """
+    frame = pd.concat([pd.DataFrame({'date': dates}), shared.store.frame(dates, features.WEATHER_COLUMNS + events)], axis=1)
+
+    return features.build_design_matrix(frame, events, shared.store.calendar_parts(dates))
+
+
+def fit_stations(datas, shared, cv=5):
+    """
+    Fit every station in one stacked solve.
+
+    datas maps each place to its clean frame (see final_script.get_clean_data)
+    and shared is the final_script.SharedInputs of the run. Returns a dict of
+    per-station results with the same metrics as final_script.analysis.
+    """
+    places = list(datas)
+    dates = pd.DatetimeIndex(sorted(set().union(*[pd.to_datetime(data['date']) for data in datas.values()])))
+    events = list(dict.fromkeys(event for place in places for event in shared.event_list[place]))
+    X, columns = build_shared_design(dates, shared, events)
+
+    # One target column per station, zero where the station has no data
+    Y = np.zeros((len(dates), len(places)))
+    present = np.zeros((len(dates), len(places)), dtype=bool)
+    for j, place in enumerate(places):
+        rows = dates.get_indexer(pd.to_datetime(datas[place]['date']))
+        Y[rows, j] = datas[place]['ridership'].to_numpy(dtype=float)
+        present[rows, j] = True
+
+    # Statistics of every fold, for every station at once
+    folds = [solver.NormalEquations.from_data(X[rows], Y[rows]) for rows in solver.kfold_slices(len(dates), cv)]
+    full = sum(folds[1:], folds[0])
+
+    results = {}
+    for j, place in enumerate(places):
+        event_lst = shared.event_list[place]
+        station_columns = features.design_columns(event_lst)
+        index = [columns.index(column) for column in station_columns]
+        rows = np.flatnonzero(present[:, j])
+        X_station = X[rows][:, index]
+        y = Y[rows, j]
+
+        if len(rows) == len(dates):
+            station_folds = [fold.select(index, j) for fold in folds]
+            station_full = full.select(index, j)
+        else:
+            station_folds = [solver.NormalEquations.from_data(X_station[fold], y[fold])
+                             for fold in solver.kfold_slices(len(rows), cv)]
+            station_full = sum(station_folds[1:], station_folds[0])
+
+        fit_intercept, cv_score = solver.cross_validate(station_full, station_folds)
+        coef, intercept = station_full.solve(fit_intercept)
+
+        # Predictions with and without the event effect
+        y_pred_event = X_station @ coef + intercept
+        event_index = [station_columns.index(event) for event in event_lst]
+        y_pred = y_pred_event - X_station[:, event_index] @ coef[event_index]
+
+        sst = np.sum((y - y.mean()) ** 2)
+        results[place] = {
+            'columns': station_columns,
+            'coef': coef,
+            'intercept': intercept,
+            'mse': np.mean((y - y_pred) ** 2),
+            'r2': 1 - np.sum((y - y_pred) ** 2) / sst,
+            'r2_event': 1 - np.sum((y - y_pred_event) ** 2) / sst,
+            'cv_score': cv_score,
+            'fit_intercept': fit_intercept,
+            'n_rows': len(rows),
+        }
+
+    return results
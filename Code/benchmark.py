@@ -0,0 +1,301 @@
+"""
+Benchmarks of the pipeline stages on synthetic data.
+
+Generates ridership, temperature and event data at a given scale (stations x
+years x event columns) in the same schema as Data/Raw, Data/Event and
+event_list.json, in a temporary folder, and times each stage:
+
+    clean       final_script.get_clean_data of every station
+    features    features.build_design_matrix of every station
+    fit         final_script.analysis of every station
+    clean_mlb   clean_MLB.clean_data of a season of scorebox rows per station
+    parse       parse_boxscore.parse_pages of synthetic boxscore pages
+
+Each stage is run `repeat` times and the best time is kept. The peak memory is
+measured with tracemalloc in one more run. The results are written as JSON
+to Output/benchmarks/<commit>_<time>.json and can be compared with an earlier run:
+
+    python benchmark.py --stations 20 --years 5 --events 30
+    python benchmark.py --compare ..\\Output\\benchmarks\\<baseline>.json
+
+Nothing is written to Data/. The models fitted by the fit stage are saved in the
+temporary folder.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import artifacts
+import clean_MLB
+import feature_store
+import features
+import final_script
+import parse_boxscore
+
+PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+
+# Set the output folder path (update the path as needed)
+OUTPUT_FOLDER = PATH + r'\Output'
+BENCHMARK_FOLDER = OUTPUT_FOLDER + r'\benchmarks'
+
+STAGES = ['clean', 'features', 'fit', 'clean_mlb', 'parse']
+
+WEATHER_TYPES = [column for column in features.WEATHER_COLUMNS if column != 'temperature']
+
+
+def make_dates(years, end='2023-12-31'):
+    end = pd.Timestamp(end)
+    return pd.date_range(end - pd.DateOffset(years=years) + pd.Timedelta(days=1), end)
+
+
+def make_temperature(dates, rng):
+    # Same columns as the NOAA daily summary in Data/Event/temperature.csv
+    season = 50 - 25 * np.cos(2 * np.pi * (dates.dayofyear - 15) / 365.25)
+    temperature = pd.DataFrame({'DATE': dates.strftime('%Y-%m-%d'),
+                                'TMAX': np.round(season + 8 + rng.normal(0, 8, len(dates))),
+                                'TMIN': np.round(season - 8 + rng.normal(0, 8, len(dates)))})
+    for column in WEATHER_TYPES:
+        temperature[column] = np.where(rng.random(len(dates)) < 0.1, 1.0, np.nan)
+    return temperature
+
+
+def make_events(dates, n_events, rng):
+    # Attendance columns with a few event days each, empty elsewhere as in Data/Event/event.csv
+    event_data = pd.DataFrame({'date': [f'{d.month}/{d.day}/{d.year}' for d in dates]})
+    for i in range(n_events):
+        days = rng.random(len(dates)) < 0.02
+        event_data[f'event_{i}'] = np.where(days, rng.integers(1000, 60000, len(dates)), np.nan)
+    return event_data
+
+
+def make_rides(dates, event_data, events, rng, n_ids=2):
+    # One row per station id and service date, in the columns of the SQL query
+    base = rng.uniform(2000, 8000)
+    effect = event_data[events].fillna(0).to_numpy() @ rng.uniform(-0.02, 0.05, len(events))
+    frames = []
+    for sort_all in range(1, n_ids + 1):
+        rides = base / n_ids * (1 + 0.2 * (dates.dayofweek < 5)) + effect / n_ids + rng.normal(0, 100, len(dates))
+        frames.append(pd.DataFrame({'YEAR': dates.year, 'MONTH': dates.month,
+                                    'SERVICE_DATE': dates.strftime('%Y-%m-%d'), 'SORT_ALL': sort_all,
+                                    'BRANCH': 'Branch', 'STATION': f'Station {sort_all}',
+                                    'RIDES': np.maximum(rides, 0).astype(int)}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def make_scorebox(n_games, rng):
+    # Raw strings with the columns scrape_MLB writes to <year>_scorebox.csv
+    dates = pd.Timestamp('2023-03-30') + pd.to_timedelta(rng.integers(0, 180, n_games), unit='D')
+    hours = rng.choice(['1:20 p.m.', '7:05 p.m.', '12:05 p.m.', '6:40 p.m.'], n_games)
+    scorebox = pd.DataFrame({
+        'TeamA': 'Team A', 'TeamB': 'Chicago Cubs',
+        'Date': dates.strftime('%A, %B %d, %Y'),
+        'Time': [f'Start Time: {hour} Local' for hour in hours],
+        'Attendance': [f'Attendance: {attendance:,}' for attendance in rng.integers(10000, 41000, n_games)],
+        'Venue': rng.choice(['Venue: Wrigley Field', 'Venue: Guaranteed Rate Field'], n_games),
+        'Duration': [f'Game Duration: {h}:{m:02d}' for h, m in zip(rng.integers(2, 4, n_games), rng.integers(0, 60, n_games))],
+        'link': [f'https://www.baseball-reference.com/boxes/CHN/CHN{date}0.shtml' for date in dates.strftime('%Y%m%d')],
+    })
+    return scorebox
+
+
+def make_page(row, padding):
+    # A boxscore page: the scorebox block followed by the large tables of a real page
+    meta = ''.join(f'<div>{row[column]}</div>' for column in ['Date', 'Time', 'Attendance', 'Venue', 'Duration'])
+    return (f'<html><body><div id="content"><div class="scorebox"><div><strong><a>{row["TeamA"]}</a></strong></div>'
+            f'<div><strong><a>{row["TeamB"]}</a></strong></div><div class="scorebox_meta">{meta}</div></div>'
+            f'{padding}</div></body></html>').encode()
+
+
+def make_workspace(folder, stations, years, events, seed=0):
+    """
+    Write the synthetic Raw files, temperature.csv, event.csv and event_list.json to folder
+    """
+    rng = np.random.default_rng(seed)
+    dates = make_dates(years)
+    os.makedirs(os.path.join(folder, 'Raw'), exist_ok=True)
+
+    temperature = make_temperature(dates, rng)
+    event_data = make_events(dates, events, rng)
+    temperature.to_csv(os.path.join(folder, 'temperature.csv'), index=False)
+    event_data.to_csv(os.path.join(folder, 'event.csv'), index=False)
+
+    event_list = {}
+    for i in range(stations):
+        place = f'station_{i}'
+        event_list[place] = sorted(rng.choice(event_data.columns[1:], min(events, max(1, events // 3)), replace=False).tolist())
+        make_rides(dates, event_data, event_list[place], rng).to_csv(os.path.join(folder, 'Raw', f'{place}.csv'), index=False)
+
+    with open(os.path.join(folder, 'event_list.json'), 'w') as f:
+        json.dump(event_list, f)
+
+    return event_list
+
+
+def measure(function, repeat):
+    """
+    Best time of repeat runs, and the peak traced memory of one more run.
+    The progress prints of the stages are not shown.
+    """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            time0 = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - time0)
+
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {'seconds': min(times), 'peak_mb': peak / 2 ** 20}, result
+
+
+def run(stations=5, years=3, events=30, games=81, pages=200, repeat=3, seed=0, folder=None):
+    """
+    Run every stage at the given scale and return the results as a dict
+    """
+    workdir = folder or tempfile.mkdtemp(prefix='ridership_benchmark_')
+    model_folder = artifacts.MODEL_FOLDER
+    try:
+        event_list = make_workspace(workdir, stations, years, events, seed)
+        store = feature_store.build_store(feature_store.read_temperature(os.path.join(workdir, 'temperature.csv')),
+                                          feature_store.read_events(os.path.join(workdir, 'event.csv')),
+                                          os.path.join(workdir, 'Features'))
+        shared = final_script.SharedInputs(store, event_list)
+        raw_paths = {place: os.path.join(workdir, 'Raw', f'{place}.csv') for place in event_list}
+
+        # Keep the fitted models out of Data/Model
+        artifacts.MODEL_FOLDER = os.path.join(workdir, 'Model')
+
+        stages = {}
+        stages['clean'], datas = measure(
+            lambda: {place: final_script.get_clean_data(path, place, shared) for place, path in raw_paths.items()}, repeat)
+        stages['features'], _ = measure(
+            lambda: [features.build_design_matrix(data, event_list[place]) for place, data in datas.items()], repeat)
+        stages['fit'], _ = measure(
+            lambda: [final_script.analysis(data.copy(), place, event_list[place], store) for place, data in datas.items()], repeat)
+
+        rng = np.random.default_rng(seed)
+        scoreboxes = [make_scorebox(games, rng) for _ in range(stations)]
+        stages['clean_mlb'], _ = measure(lambda: [clean_MLB.clean_data(scorebox.copy()) for scorebox in scoreboxes], repeat)
+
+        padding = '<table>' + '<tr><td>0</td><td>1</td><td>2</td></tr>' * 2000 + '</table>'
+        season = make_scorebox(pages, rng)
+        contents = [make_page(row, padding) for _, row in season.iterrows()]
+        stages['parse'], _ = measure(lambda: parse_boxscore.parse_pages(contents), repeat)
+
+        rows = sum(len(data) for data in datas.values())
+        for stage in ['clean', 'features', 'fit']:
+            stages[stage]['rows'] = rows
+        stages['clean_mlb']['rows'] = games * stations
+        stages['parse']['rows'] = pages
+
+    finally:
+        artifacts.MODEL_FOLDER = model_folder
+        if folder is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'commit': git_commit(),
+        'created': pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'scale': {'stations': stations, 'years': years, 'events': events, 'games': games, 'pages': pages,
+                  'repeat': repeat, 'seed': seed},
+        'stages': stages,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def save(results, path=None):
+    if path is None:
+        os.makedirs(BENCHMARK_FOLDER, exist_ok=True)
+        stamp = results['created'].replace('-', '').replace(':', '').replace(' ', '_')
+        path = os.path.join(BENCHMARK_FOLDER, f'{results["commit"]}_{stamp}.json')
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def compare(baseline, current, threshold=1.2):
+    """
+    Time and memory of each stage relative to a baseline run (dicts or JSON paths).
+    Returns the stages that are slower or use more memory than threshold times the baseline.
+    """
+    if isinstance(baseline, str):
+        with open(baseline, 'r') as f:
+            baseline = json.load(f)
+    if isinstance(current, str):
+        with open(current, 'r') as f:
+            current = json.load(f)
+    if baseline['scale'] != current['scale']:
+        print(f'Warning: different scales {baseline["scale"]} and {current["scale"]}')
+
+    regressions = []
+    print(f'{"stage":<10} {"seconds":>10} {"ratio":>7} {"peak_mb":>10} {"ratio":>7}')
+    for stage in STAGES:
+        if stage not in baseline['stages'] or stage not in current['stages']:
+            continue
+        old, new = baseline['stages'][stage], current['stages'][stage]
+        time_ratio = new['seconds'] / old['seconds'] if old['seconds'] else float('nan')
+        memory_ratio = new['peak_mb'] / old['peak_mb'] if old['peak_mb'] else float('nan')
+        print(f'{stage:<10} {new["seconds"]:>10.4f} {time_ratio:>7.2f} {new["peak_mb"]:>10.1f} {memory_ratio:>7.2f}')
+        if time_ratio > threshold or memory_ratio > threshold:
+            regressions.append(stage)
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on synthetic data')
+    parser.add_argument('--stations', type=int, default=5)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--events', type=int, default=30, help='number of event columns')
+    parser.add_argument('--games', type=int, default=81, help='scorebox rows per station for clean_mlb')
+    parser.add_argument('--pages', type=int, default=200, help='boxscore pages for parse')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON file to write (default: Output/benchmarks/<commit>_<time>.json)')
+    parser.add_argument('--compare', help='JSON file of a baseline run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2, help='ratio to the baseline reported as a regression')
+    args = parser.parse_args(argv)
+
+    results = run(args.stations, args.years, args.events, args.games, args.pages, args.repeat, args.seed)
+    path = save(results, args.output)
+    print(f'Saved {path}')
+
+    for stage, result in results['stages'].items():
+        print(f'{stage:<10} {result["seconds"]:>10.4f} s {result["peak_mb"]:>10.1f} MB {result["rows"]:>10} rows')
+
+    if args.compare:
+        regressions = compare(args.compare, results, args.threshold)
+        if regressions:
+            print(f'Regressions: {", ".join(regressions)}')
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
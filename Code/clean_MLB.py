@@ -1,13 +1,29 @@
 import pandas as pd
+import numpy as np
 import re
 import os
 
+import event_features
+
 PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
 
 # Set the data folder path (update the path as needed)
 DATA_FOLDER = PATH + r'\Data'
 OUTPUT_FOLDER = PATH + r'\Output'
 
+# Patterns of the raw scorebox strings
+TIME_PATTERN = re.compile(r'(\d+):(\d+)')
+PM_PATTERN = re.compile(r'p.m.')
+ATTENDANCE_PATTERN = re.compile(r'Attendance: (\d{1,3}(?:,\d{3})+|\d+)')
+VENUE_PATTERN = re.compile(r'Venue: (.+)')
+DURATION_PATTERN = re.compile(r'Game Duration: (\d+:\d+)')
+
+def _infer(values):
+    # Missing values as None and the dtype pandas infers for a column of strings,
+    # the same as the row-wise version of clean_data produced
+    return pd.Series(values.astype(object).where(values.notna(), None).tolist(), index=values.index)
+
+
 def clean_data(data):
     # Convert date format
     try:
@@ -20,60 +36,34 @@ def clean_data(data):
     except:
         pass
 
-    # Convert time format
-    def get_start_time(row):
-        time = re.search(r'\d+:\d+', row['Time'])
-        if pd.isnull(time):
-            return None
-        pm = re.search(r'p.m.', row['Time'])
-        if pm:
-            hour = int(time.group(0).split(':')[0]) + 12
-            if hour == 24:
-                hour = 12
-            return str(hour) + ':' + time.group(0).split(':')[1]
-        return time.group(0)
-
-    data['Time'] = data.apply(get_start_time, axis=1)
+    # Convert time format, e.g. '7:05 p.m.' -> '19:05' (12 p.m. stays 12)
+    time = data['Time'].str.extract(TIME_PATTERN)
+    pm = data['Time'].str.contains(PM_PATTERN, na=False).to_numpy()
+    hour = pd.to_numeric(time[0]) + 12
+    hour = hour.where(hour != 24, 12).astype('Int64').astype('string')
+    start_time = np.where(pm, hour + ':' + time[1], time[0] + ':' + time[1])
+    data['Time'] = _infer(pd.Series(start_time, index=data.index).where(time[0].notna()))
 
     # Convert attendance format
-    def get_attendance(row):
-        if pd.isnull(row['Attendance']):
-            return None
-        attendance = re.search(r'Attendance: (\d+,\d+)', row['Attendance'])
-        if attendance:
-            return int(attendance.group(1).replace(',', ''))
-        return None
-
-    data['Attendance'] = data.apply(get_attendance, axis=1)
+    attendance = data['Attendance'].str.extract(ATTENDANCE_PATTERN, expand=False).str.replace(',', '')
+    attendance = pd.to_numeric(attendance)
+    data['Attendance'] = attendance.astype('int64') if attendance.notna().all() else attendance
 
     # Convert venue format
-    def get_venue(row):
-        if pd.isnull(row['Venue']):
-            return None
-        venue = re.search(r'Venue: (.+)', row['Venue'])
-        if venue:
-            return venue.group(1)
-        return None
+    data['Venue'] = _infer(data['Venue'].str.extract(VENUE_PATTERN, expand=False))
 
-    data['Venue'] = data.apply(get_venue, axis=1)
+    data['Duration'] = _infer(data['Duration'].str.extract(DURATION_PATTERN, expand=False))
 
-    def get_duration(row):
-        if pd.isnull(row['Duration']):
-            return None
-        duration = re.search(r'Game Duration: (\d+:\d+)', row['Duration'])
-        if duration:
-            return duration.group(1)
-        return None
-    
-    data['Duration'] = data.apply(get_duration, axis=1)
-
-
-    # Create interaction terms
-    for i in range(7):
-        data[f'day_of_week_{i}_day_night'] = data[f'day_of_week_{i}'] * data['day_night']
+    return data
 
 
-    return data
+def scorebox_events(data):
+    """
+    Games of a clean scorebox frame in the long format of event_features
+    """
+    return pd.DataFrame({'date': data['Date'], 'venue': data['Venue'], 'kind': 'baseball',
+                         'attendance': data['Attendance'], 'start_time': data['Time'],
+                         'duration': data['Duration']})[event_features.SOURCE_COLUMNS]
 
 
 def main():
@@ -85,44 +75,13 @@ def main():
 
     data['Date'] = pd.to_datetime(data['Date'])
 
-    data['day_of_week'] = data['Date'].dt.dayofweek  # Monday is 0 and Sunday is 6
-
-    # make day_of_week 0 to 3 as Weekday(nofriday) and 4 Friday, 5 Saturday, 6 Sunday
-    data['day_of_week'] = data['day_of_week'].apply(lambda x: 'Weekday(nofriday)' if x < 4 else x)
-    data['day_of_week'] = data['day_of_week'].apply(lambda x: 'Friday' if x == 4 else x)
-    data['day_of_week'] = data['day_of_week'].apply(lambda x: 'Saturday' if x == 5 else x)
-    data['day_of_week'] = data['day_of_week'].apply(lambda x: 'Sunday' if x == 6 else x)
-
-    data['day_night'] = data['Time'].apply(lambda x: 0 if x.split(':')[0] < '17' else 1) # 0 for day and 1 for night
-
-    # except weekday(nofriday), make all other day and night as 0
-    data.loc[data['day_of_week'] != 'Weekday(nofriday)', 'day_night'] = 0
-
-    # create column weekday(nofriday) day and night, Friday, Saturday, Sunday 
-    data = data.join(pd.get_dummies(data['day_of_week'], prefix=None, dtype=int))
-    data.drop(columns=['day_of_week'], inplace=True)
-
-    # Create interaction terms
-    data['sport_game_attendence_day_weekday(nofri)'] = 0
-    data['sport_game_attendence_night_weekday(nofri)'] = 0
-
-    data.loc[(data['Weekday(nofriday)'] == 1) & (data['day_night'] == 0), 'sport_game_attendence_day_weekday(nofri)'] = 1
-    data.loc[(data['Weekday(nofriday)'] == 1) & (data['day_night'] == 1), 'sport_game_attendence_night_weekday(nofri)'] = 1
-
-    # let column Friday, Saturday, Sunday, sport_game_attendence_day_weekday(nofri), sport_game_attendence_night_weekday(nofri) multiply with Attendance
-    data['sport_game_attendence_fri'] = data['Friday'] * data['Attendance']
-    data['sport_game_attendence_sat'] = data['Saturday'] * data['Attendance']
-    data['sport_game_attendence_sun'] = data['Sunday'] * data['Attendance']
-    data['sport_game_attendence_day_weekday(nofri)'] = data['sport_game_attendence_day_weekday(nofri)'] * data['Attendance']
-    data['sport_game_attendence_night_weekday(nofri)'] = data['sport_game_attendence_night_weekday(nofri)'] * data['Attendance']
-
-    # only keep record in wrigley field
-    data = data[data['Venue'] == 'Wrigley Field']
-
-    # keep only the columns that are needed
-    data = data[['Date', 'sport_game_attendence_fri', 'sport_game_attendence_sat', 'sport_game_attendence_sun', 'sport_game_attendence_day_weekday(nofri)', 'sport_game_attendence_night_weekday(nofri)']]
+    # Long-format events, one row per game
+    events = scorebox_events(data)
+    event_features.add_events(events)
 
-    data.rename(columns={'Date': 'date'}, inplace=True)
+    # Attendance by day of week and day/night at Wrigley Field, doubleheaders summed per date
+    data = event_features.build_columns(events, event_features.WRIGLEY_SPECS).fillna(0).astype(int)
+    data = data.rename_axis(columns=None).reset_index()
 
     data.to_csv(DATA_FOLDER + '\\Event\\Baseball_in_wrigley_field\\' + 'addison.csv', index=False)
 
@@ -0,0 +1,212 @@
+"""
+Event-feature engine: generates the event.csv columns from a long-format event table.
+
+The source table (Data/Event/event_sources.csv) has one row per event:
+
+    date, venue, kind, attendance, start_time, duration
+
+e.g. 2023-04-10, Wrigley Field, baseball, 35144, 13:20, 2:45
+
+Each generated column is described by a spec, a plain dict:
+
+    column  name of the column in event.csv
+    venue   venue of the events (None for any venue)
+    kind    kind of the events (None for any kind)
+    days    days of week the event must fall on, Monday is 0 (None for any day)
+    start   'day' or 'night' to split on the start time (None for both)
+    value   'attendance' to sum the attendance, or 'count' to count the events
+
+A game is a night game if it starts at NIGHT_HOUR or later. Events on the same
+date are summed, so a doubleheader gives one row with the attendance of both games.
+
+All the columns are built with one pivot of the matched events. update_event_file()
+keeps a manifest with a hash of each column's spec and matched events, and only
+regenerates the columns whose hash changed. Columns of event.csv without a spec
+(the hand-maintained ones) are written back unchanged.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+
+# Set the data folder path (update the path as needed)
+DATA_FOLDER = PATH + r'\Data'
+SOURCE_PATH = DATA_FOLDER + r'\Event\event_sources.csv'
+EVENT_PATH = DATA_FOLDER + r'\Event\event.csv'
+MANIFEST_PATH = DATA_FOLDER + r'\Event\event_manifest.json'
+
+SOURCE_COLUMNS = ['date', 'venue', 'kind', 'attendance', 'start_time', 'duration']
+
+NIGHT_HOUR = 17
+
+WEEKDAYS_NO_FRIDAY = [0, 1, 2, 3]
+
+# Attendance of the baseball games at Wrigley Field, for the addison station
+WRIGLEY_SPECS = [
+    {'column': 'sport_game_attendence_fri', 'venue': 'Wrigley Field', 'kind': 'baseball', 'days': [4], 'start': None, 'value': 'attendance'},
+    {'column': 'sport_game_attendence_sat', 'venue': 'Wrigley Field', 'kind': 'baseball', 'days': [5], 'start': None, 'value': 'attendance'},
+    {'column': 'sport_game_attendence_sun', 'venue': 'Wrigley Field', 'kind': 'baseball', 'days': [6], 'start': None, 'value': 'attendance'},
+    {'column': 'sport_game_attendence_day_weekday(nofri)', 'venue': 'Wrigley Field', 'kind': 'baseball', 'days': WEEKDAYS_NO_FRIDAY, 'start': 'day', 'value': 'attendance'},
+    {'column': 'sport_game_attendence_night_weekday(nofri)', 'venue': 'Wrigley Field', 'kind': 'baseball', 'days': WEEKDAYS_NO_FRIDAY, 'start': 'night', 'value': 'attendance'},
+]
+
+SPECS = WRIGLEY_SPECS
+
+
+def load_events(path=None):
+    """
+    Read the long-format event table
+    """
+    events = pd.read_csv(path or SOURCE_PATH)
+    events['date'] = pd.to_datetime(events['date'])
+    return events
+
+
+def add_events(new_events, path=None):
+    """
+    Add events to the long-format table. An event already in the table (same
+    date, venue, kind and start time) is replaced by the new row.
+    """
+    path = path or SOURCE_PATH
+    new_events = new_events[SOURCE_COLUMNS].copy()
+    new_events['date'] = pd.to_datetime(new_events['date'])
+    if os.path.exists(path):
+        new_events = pd.concat([load_events(path), new_events], ignore_index=True)
+
+    events = new_events.drop_duplicates(['date', 'venue', 'kind', 'start_time'], keep='last')
+    events = events.sort_values('date', kind='stable').reset_index(drop=True)
+    events.to_csv(path, index=False)
+
+    return events
+
+
+def match(events, spec):
+    """
+    Boolean mask of the events counted in the column of spec
+    """
+    mask = np.ones(len(events), dtype=bool)
+    if spec.get('venue') is not None:
+        mask &= (events['venue'] == spec['venue']).to_numpy()
+    if spec.get('kind') is not None:
+        mask &= (events['kind'] == spec['kind']).to_numpy()
+    if spec.get('days') is not None:
+        mask &= events['date'].dt.dayofweek.isin(spec['days']).to_numpy()
+    if spec.get('start') is not None:
+        hour = pd.to_numeric(events['start_time'].astype('string').str.split(':').str[0], errors='coerce')
+        night = (hour >= NIGHT_HOUR).to_numpy(dtype=bool)
+        known = hour.notna().to_numpy(dtype=bool)
+        mask &= known & (night if spec['start'] == 'night' else ~night)
+    return mask
+
+
+def event_values(events, spec):
+    if spec.get('value', 'attendance') == 'count':
+        return np.ones(len(events))
+    return pd.to_numeric(events['attendance'], errors='coerce').fillna(0).to_numpy(dtype=float)
+
+
+def build_columns(events, specs=None):
+    """
+    Wide frame of the spec columns, indexed by date. Dates without any
+    matched event are left out, missing entries are NaN.
+    """
+    specs = SPECS if specs is None else specs
+    columns = [spec['column'] for spec in specs]
+
+    # Stack the (event, column) pairs of every spec and pivot them in one go
+    matched = [np.flatnonzero(match(events, spec)) for spec in specs]
+    rows = np.concatenate(matched + [np.empty(0, dtype=int)])
+    pairs = pd.DataFrame({
+        'date': events['date'].to_numpy()[rows],
+        'column': np.repeat(columns, [len(index) for index in matched]),
+        'value': np.concatenate([event_values(events, spec)[index] for spec, index in zip(specs, matched)] + [np.empty(0)]),
+    })
+    wide = pairs.pivot_table(index='date', columns='column', values='value', aggfunc='sum')
+
+    return wide.reindex(columns=columns)
+
+
+def column_hashes(events, specs=None):
+    """
+    Hash of each spec and the events it matches
+    """
+    specs = SPECS if specs is None else specs
+    hashes = {}
+    for spec in specs:
+        mask = match(events, spec)
+        h = hashlib.sha256(json.dumps(spec, sort_keys=True).encode())
+        h.update(events['date'].to_numpy()[mask].astype('datetime64[ns]').tobytes())
+        h.update(event_values(events, spec)[mask].tobytes())
+        hashes[spec['column']] = h.hexdigest()
+    return hashes
+
+
+def format_column(values):
+    # Whole numbers without a decimal point and blanks for missing values, as in the hand-made file
+    if values.dropna().mod(1).eq(0).all():
+        values = values.astype('Int64')
+    return values.astype(object).where(values.notna(), '').astype(str)
+
+
+def format_dates(dates):
+    dates = pd.DatetimeIndex(dates)
+    return dates.month.astype(str) + '/' + dates.day.astype(str) + '/' + dates.year.astype(str)
+
+
+def update_event_file(events=None, specs=None, event_path=None, manifest_path=None):
+    """
+    Regenerate the columns of event.csv whose source events or spec changed.
+    Returns the names of the regenerated columns.
+    """
+    events = load_events() if events is None else events
+    specs = SPECS if specs is None else specs
+    event_path = event_path or EVENT_PATH
+    manifest_path = manifest_path or MANIFEST_PATH
+
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+    # Keep the existing file as text so the untouched columns are written back as they are
+    if os.path.exists(event_path):
+        event_data = pd.read_csv(event_path, dtype=str, keep_default_na=False)
+    else:
+        event_data = pd.DataFrame({'date': pd.Series(dtype=str)})
+
+    hashes = column_hashes(events, specs)
+    changed = [spec for spec in specs
+               if manifest.get(spec['column']) != hashes[spec['column']] or spec['column'] not in event_data.columns]
+    if not changed:
+        print('event.csv is up to date')
+        return []
+
+    wide = build_columns(events, changed)
+
+    # Add the event dates that are not in the file yet
+    dates = pd.to_datetime(event_data['date'])
+    new_dates = wide.index.difference(pd.DatetimeIndex(dates))
+    if len(new_dates):
+        event_data = pd.concat([event_data, pd.DataFrame({'date': format_dates(new_dates)})], ignore_index=True).fillna('')
+        dates = pd.to_datetime(event_data['date'])
+
+    for spec in changed:
+        event_data[spec['column']] = format_column(wide[spec['column']].reindex(dates).reset_index(drop=True))
+        manifest[spec['column']] = hashes[spec['column']]
+
+    event_data = event_data.iloc[np.argsort(dates.to_numpy(), kind='stable')]
+    event_data.to_csv(event_path, index=False)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f'Regenerated {len(changed)} columns of event.csv')
+    return [spec['column'] for spec in changed]
+
+
+def main():
+    return update_event_file()
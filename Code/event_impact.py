@@ -0,0 +1,89 @@
+"""
+Counterfactual event impact from a fitted station model.
+
+The model is linear, so the lift of an event on a date is its coefficient
+times the value of its column on that date:
+
+    lift(event, date) = coef[event] * value(event, date)
+
+and the ridership without the event is the prediction (or the actual
+ridership) minus the lift. Nothing is refitted and the design matrix is not
+predicted again; only the event columns of the requested dates are read.
+
+A model is a dict with the 'columns' and 'coef' of a fitted station, as
+returned by batch.fit_stations or incremental.update_station. Event values are
+read from the feature store (see feature_store.py) unless given.
+
+Example: lift of the marathon at the airport stations on October 8, 2023
+
+    store = feature_store.load_store()
+    impact_table(models, ['2023-10-08'], store, events=['marathon'])
+"""
+
+import numpy as np
+import pandas as pd
+
+import features
+
+
+def lift(coef, columns, values, events):
+    """
+    Lift of each event (columns of values) on each row of values
+    """
+    index = [columns.index(event) for event in events]
+    return np.asarray(values, dtype=float) * np.asarray(coef)[index]
+
+
+def station_impact(model, dates, store, events=None, values=None):
+    """
+    Lift of the events of one station on dates, as an array of dates x events.
+    events defaults to every event column of the model.
+    """
+    events = list(events) if events is not None else event_columns(model)
+    if values is None:
+        values = store.take(pd.DatetimeIndex(dates), events)
+    return lift(model['coef'], model['columns'], values, events)
+
+
+def event_columns(model):
+    # Every column of the model that is not a calendar or weather feature
+    return [column for column in model['columns']
+            if column not in features.WEATHER_COLUMNS and column not in features.calendar_columns()]
+
+
+def impact_table(models, dates, store, events=None):
+    """
+    Lift of the events of every station in models on dates, in long format
+    (station, date, event, value, lift). Only the events a station was fitted
+    with are reported for it; rows with no event (value 0) are left out.
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    tables = []
+    for place, model in models.items():
+        station_events = event_columns(model)
+        if events is not None:
+            station_events = [event for event in station_events if event in events]
+        if not station_events:
+            continue
+
+        values = store.take(dates, station_events)
+        lifts = lift(model['coef'], model['columns'], values, station_events)
+        rows, cols = np.nonzero(values)
+        tables.append(pd.DataFrame({
+            'station': place,
+            'date': dates[rows],
+            'event': np.asarray(station_events, dtype=object)[cols],
+            'value': values[rows, cols],
+            'lift': lifts[rows, cols],
+        }))
+
+    if not tables:
+        return pd.DataFrame(columns=['station', 'date', 'event', 'value', 'lift'])
+    return pd.concat(tables, ignore_index=True).sort_values(['station', 'date', 'event'], kind='stable').reset_index(drop=True)
+
+
+def without_events(ridership, lifts):
+    """
+    Ridership with the lift of every event removed
+    """
+    return np.asarray(ridership, dtype=float) - np.asarray(lifts).sum(axis=1)
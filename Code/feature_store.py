@@ -0,0 +1,173 @@
+"""
+Date-indexed feature store.
+
+The calendar, weather and event features of every date are kept in one
+float64 array in Data/Features/features.npy, with one row per day from the
+first to the last date of temperature.csv and event.csv. Row i is the date
+start + i days, so the rows of a station are found by subtracting day numbers
+instead of merging frames on the date. Missing weather and event values are 0,
+as after the fillna(0) of the merges. Dates outside the store are all 0. The
+first and last dates of temperature.csv are kept, so callers can tell a date
+without weather from a day at 0 degrees (see weather_missing).
+
+The array is opened memory-mapped, so the worker processes of a parallel run
+share the same pages instead of each receiving a copy. The store is rebuilt
+when temperature.csv or event.csv change (size or modification time).
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import features
+
+PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+
+# Set the data folder path (update the path as needed)
+DATA_FOLDER = PATH + r'\Data'
+FEATURE_FOLDER = DATA_FOLDER + r'\Features'
+TEMPERATURE_PATH = DATA_FOLDER + '\\Event\\' + 'temperature.csv'
+EVENT_PATH = DATA_FOLDER + r'\Event\event.csv'
+
+CALENDAR_COLUMNS = ['day_of_week', 'month', 'week', 'day_of_year']
+
+
+class FeatureStore:
+    """
+    Memory-mapped array of the features of every date, opened on first use
+    """
+
+    def __init__(self, folder=None):
+        self.folder = folder or FEATURE_FOLDER
+        with open(os.path.join(self.folder, 'features.json'), 'r') as f:
+            self.meta = json.load(f)
+        self.columns = self.meta['columns']
+        self.start = pd.Timestamp(self.meta['start'])
+        self.n_days = self.meta['n_days']
+        self.index = {column: i for i, column in enumerate(self.columns)}
+        self._array = None
+
+    @property
+    def array(self):
+        if self._array is None:
+            self._array = np.load(os.path.join(self.folder, 'features.npy'), mmap_mode='r')
+        return self._array
+
+    def __getstate__(self):
+        # Send only the location to worker processes, each maps the file itself
+        state = self.__dict__.copy()
+        state['_array'] = None
+        return state
+
+    def positions(self, dates):
+        """
+        Row of each date, and whether the date is in the store
+        """
+        days = (pd.DatetimeIndex(dates) - self.start).days.to_numpy()
+        valid = (days >= 0) & (days < self.n_days)
+        return np.where(valid, days, 0), valid
+
+    def take(self, dates, columns):
+        """
+        Values of columns on dates as an array, 0 for dates outside the store
+        """
+        rows, valid = self.positions(dates)
+        values = self.array[rows][:, [self.index[column] for column in columns]]
+        values[~valid] = 0
+        return values
+
+    def frame(self, dates, columns):
+        return pd.DataFrame(self.take(dates, columns), columns=columns)
+
+    def weather_missing(self, dates):
+        """
+        Whether each date is outside the dates of temperature.csv, so its weather is 0
+        """
+        dates = pd.DatetimeIndex(dates)
+        return np.asarray((dates < pd.Timestamp(self.meta['weather_start'])) | (dates > pd.Timestamp(self.meta['weather_end'])))
+
+    def calendar_parts(self, dates):
+        """
+        Same as features.calendar_parts, read from the store
+        """
+        rows, valid = self.positions(dates)
+        if not valid.all():
+            return features.calendar_parts(dates)
+        values = self.array[rows][:, [self.index[column] for column in CALENDAR_COLUMNS]].astype(int)
+        return tuple(values.T)
+
+
+def read_temperature(path=None):
+    temperature = pd.read_csv(path or TEMPERATURE_PATH)
+
+    # preporcess the temperature data
+    temperature['DATE'] = pd.to_datetime(temperature['DATE'])
+    temperature['temperature'] = (temperature['TMAX'] + temperature['TMIN']) / 2
+
+    return temperature[['DATE'] + features.WEATHER_COLUMNS]
+
+
+def read_events(path=None):
+    event_data = pd.read_csv(path or EVENT_PATH)
+    event_data['date'] = pd.to_datetime(event_data['date'])
+    return event_data
+
+
+def source_signature(paths):
+    return {path: [os.path.getsize(path), os.path.getmtime(path)] for path in paths}
+
+
+def build_store(temperature, event_data, folder=None, signature=None):
+    """
+    Write the feature array of the temperature and event frames and open it
+    """
+    folder = folder or FEATURE_FOLDER
+    os.makedirs(folder, exist_ok=True)
+
+    temperature = temperature.drop_duplicates('DATE', keep='last').set_index('DATE')
+    event_data = event_data.drop_duplicates('date', keep='last').set_index('date')
+    dates = pd.date_range(min(temperature.index.min(), event_data.index.min()),
+                          max(temperature.index.max(), event_data.index.max()))
+
+    event_columns = list(event_data.columns)
+    columns = CALENDAR_COLUMNS + features.WEATHER_COLUMNS + event_columns
+    array = np.lib.format.open_memmap(os.path.join(folder, 'features.npy.tmp'), mode='w+',
+                                      dtype=np.float64, shape=(len(dates), len(columns)))
+    array[:, :len(CALENDAR_COLUMNS)] = np.column_stack(features.calendar_parts(dates))
+    array[:, len(CALENDAR_COLUMNS):len(CALENDAR_COLUMNS) + len(features.WEATHER_COLUMNS)] = (
+        temperature[features.WEATHER_COLUMNS].reindex(dates).fillna(0).to_numpy(dtype=float))
+    array[:, len(CALENDAR_COLUMNS) + len(features.WEATHER_COLUMNS):] = (
+        event_data.reindex(dates).fillna(0).to_numpy(dtype=float))
+    array.flush()
+    del array
+    os.replace(os.path.join(folder, 'features.npy.tmp'), os.path.join(folder, 'features.npy'))
+
+    meta = {'columns': columns, 'start': dates[0].strftime('%Y-%m-%d'), 'n_days': len(dates),
+            'weather_start': temperature.index.min().strftime('%Y-%m-%d'),
+            'weather_end': temperature.index.max().strftime('%Y-%m-%d'),
+            'sources': signature or {}}
+    with open(os.path.join(folder, 'features.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    return FeatureStore(folder)
+
+
+def load_store(temperature_path=None, event_path=None, folder=None):
+    """
+    Open the feature store, rebuilding it if the source files changed
+    """
+    folder = folder or FEATURE_FOLDER
+    signature = source_signature([temperature_path or TEMPERATURE_PATH, event_path or EVENT_PATH])
+    try:
+        store = FeatureStore(folder)
+        # Stores written before the weather dates were kept are rebuilt
+        if (store.meta['sources'] == signature and 'weather_end' in store.meta
+                and os.path.exists(os.path.join(folder, 'features.npy'))):
+            return store
+    except FileNotFoundError:
+        pass
+
+    print('Building the feature store')
+    return build_store(read_temperature(temperature_path), read_events(event_path), folder, signature)
@@ -0,0 +1,85 @@
+"""
+Sparse design-matrix builder for the station regression.
+
+Builds the calendar, weather and event features of analysis() as a scipy
+sparse matrix. The calendar dummies (day of week, month, ISO week and
+squared ISO week) are written straight into the sparse structure instead of
+being expanded with pd.get_dummies, so memory grows with the number of nonzero
+entries rather than rows x columns.
+
+Column names are stable: every month and every ISO week gets a column whether
+or not it appears in the data, so matrices built for different stations or
+date ranges line up column by column.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+WEATHER_COLUMNS = ['temperature', 'WT01', 'WT02', 'WT03', 'WT04', 'WT05', 'WT06', 'WT08', 'WT09', 'WT10']
+
+DAYS = range(7)
+MONTHS = range(1, 13)
+WEEKS = range(1, 54)
+
+
+def calendar_columns():
+    """
+    Names of the calendar columns, in the order they appear in the design matrix.
+    """
+    return (['day_of_year', 'p2_temperature']
+            + [f'day_of_week_{i}' for i in DAYS]
+            + [f'day_of_week_{i}_week' for i in DAYS]
+            + [f'month_{m}' for m in MONTHS]
+            + [f'week_{w}' for w in WEEKS]
+            + [f'p2_week_{w ** 2}' for w in WEEKS])
+
+
+def design_columns(event_lst):
+    return WEATHER_COLUMNS + list(event_lst) + calendar_columns()
+
+
+def calendar_parts(dates):
+    """
+    Day of week (Monday is 0), month, ISO week and day of year of each date.
+    """
+    dates = pd.DatetimeIndex(dates)
+    return (np.asarray(dates.dayofweek), np.asarray(dates.month),
+            np.asarray(dates.isocalendar().week, dtype=int), np.asarray(dates.dayofyear))
+
+
+def build_design_matrix(data, event_lst, parts=None):
+    """
+    Build the design matrix of a clean station frame (see final_script.get_clean_data).
+    parts are the calendar parts of the dates if already known (see calendar_parts).
+
+    Returns a CSR matrix and the list of its column names.
+    """
+    n = len(data)
+    rows = np.arange(n)
+    day_of_week, month, week, day_of_year = parts if parts is not None else calendar_parts(data['date'])
+
+    # Weather, event and numeric calendar columns
+    temperature = data['temperature'].to_numpy(dtype=float)
+    numeric = np.column_stack([data[WEATHER_COLUMNS + list(event_lst)].to_numpy(dtype=float),
+                               day_of_year, temperature ** 2])
+    numeric = sparse.coo_matrix(numeric)
+
+    # One nonzero per row for each of the dummy groups
+    offset = numeric.shape[1]
+    blocks = [
+        (offset + day_of_week, np.ones(n)),
+        (offset + len(DAYS) + day_of_week, week.astype(float)),
+        (offset + 2 * len(DAYS) + month - 1, np.ones(n)),
+        (offset + 2 * len(DAYS) + len(MONTHS) + week - 1, np.ones(n)),
+        (offset + 2 * len(DAYS) + len(MONTHS) + len(WEEKS) + week - 1, np.ones(n)),
+    ]
+
+    columns = design_columns(event_lst)
+    X = sparse.coo_matrix(
+        (np.concatenate([numeric.data] + [values for _, values in blocks]),
+         (np.concatenate([numeric.row] + [rows] * len(blocks)),
+          np.concatenate([numeric.col] + [cols for cols, _ in blocks]))),
+        shape=(n, len(columns)))
+
+    return X.tocsr(), columns
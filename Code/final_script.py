@@ -6,28 +6,44 @@ Libraries used:
 - pandas for data manipulation and analysis.
 - numpy for mathematical operations.
 - matplotlib for data visualization.
-- sklearn for machine learning algorithms and evaluation metrics.
-- statsmodels for statistical modeling.
 
 Please update the DATA_FOLDER and OUTPUT_FOLDER paths as needed.
 
+It can also be run from the command line, one subcommand per stage:
+
+    python final_script.py pull --start 01jan2019 --end 31dec2023 --station addison=1420
+    python final_script.py clean
+    python final_script.py fit --jobs 4
+    python final_script.py report
+    python final_script.py predict --station addison --start 2024-01-01 --end 2024-01-31
+
+The plots and Excel files are made by the report stage (see report.py).
+matplotlib, the Oracle client and the batch solver are only imported by the
+stages that use them, so fit-only and predict-only runs start quickly and
+work without the Oracle Instant Client.
+
 """
 
 # Import necessary libraries
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.model_selection import train_test_split, GridSearchCV
-from sklearn.linear_model import LinearRegression
-from sklearn.metrics import mean_squared_error, r2_score
-from sklearn.preprocessing import MinMaxScaler, PolynomialFeatures
 import os
+import sys
+import argparse
 import json
+import time
+import traceback
 import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 warnings.filterwarnings('ignore')
 
 # Helper function
-import pull_data
+import solver
+import features
+import feature_store
+import event_impact
+import artifacts
+import telemetry
 
 # Print the current working directory's parent directory
 PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
@@ -36,118 +52,108 @@ PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
 DATA_FOLDER = PATH + r'\Data'
 OUTPUT_FOLDER = PATH + r'\Output'
 
-def analysis(data, place, event_lst):
+
+def mean_squared_error(y_true, y_pred):
+    return np.mean((np.asarray(y_true) - np.asarray(y_pred)) ** 2)
+
+
+def r2_score(y_true, y_pred):
+    y_true = np.asarray(y_true, dtype=float)
+    return 1 - np.sum((y_true - np.asarray(y_pred)) ** 2) / np.sum((y_true - y_true.mean()) ** 2)
+
+
+def analysis(data, place, event_lst, store=None):
 
 
     #preprocess the dataset
     data['date'] = pd.to_datetime(data['date'])
-    data['year'] = data['date'].dt.year
-    data['month'] = data['date'].dt.month
-    data['day_of_week'] = data['date'].dt.dayofweek  # Monday is 0 and Sunday is 6
-    data['week'] = data['date'].apply(lambda x: x.isocalendar()[1])
-    data['day_of_year'] = data['date'].dt.dayofyear
-    data['p2_week'] = data['week'] ** 2 
-    data['p2_temperature'] = data['temperature'] ** 2
     data = data.fillna(0)
-    data = data.join(pd.get_dummies(data['day_of_week'], prefix='day_of_week', dtype=int))
-    data.drop(columns=['day_of_week'], inplace=True)
-
-    # Create interaction terms
-    for i in range(7):
-        data[f'day_of_week_{i}_week'] = data[f'day_of_week_{i}'] * data['week']
-
-    # Convert categorical features to dummy variables
-    categorical_features = ['month', 'week', 'p2_week']
-    data = pd.get_dummies(data, columns=categorical_features, dtype=int)
 
     # Split the data into training and testing sets
     # Linear_train = data[data['year'] == 2023]
     # Linear_test = data[data['year'] == 2023]
 
-    Linear_train = data.copy()
-    Linear_test = data.copy()
+    Linear_train = data
+    Linear_test = data
 
-
-    # Clean event effect
-    for event in event_lst:
-        Linear_test[event] = 0
-
-    # Prepare features and target variable
-    X_train = Linear_train.drop(['date', 'ridership', 'year'], axis=1)
+    # Build the calendar, weather and event features as a sparse matrix
+    # (the calendar parts are read from the feature store when one is given)
+    with telemetry.stage('features', place) as stage:
+        parts = store.calendar_parts(Linear_train['date']) if store is not None else None
+        X_train, columns = features.build_design_matrix(Linear_train, event_lst, parts)
+        stage.set(rows=X_train.shape[0], columns=X_train.shape[1], nnz=X_train.nnz)
     y_train = Linear_train['ridership']
-    X_test = Linear_test.drop(['date', 'ridership', 'year'], axis=1)
     y_test = Linear_test['ridership']
 
-    # Perform grid search to optimize model parameters
-    param_grid = {'fit_intercept': [True, False]}
-    grid_search = GridSearchCV(estimator=LinearRegression(), param_grid=param_grid, cv=5)
-    grid_search.fit(X_train, y_train)
+    # Choose fit_intercept by 5-fold cross-validation, solved from the normal equations
+    with telemetry.stage('fit', place, rows=len(y_train)):
+        model = solver.NormalEquationsCV(cv=5)
+        model.fit(X_train, y_train)
 
     # Predict using the optimized model
-    y_pred = grid_search.predict(X_test)
-    y_pred_event = grid_search.predict(X_train)
+    y_pred_event = model.predict(X_train)
+
+    # Clean event effect: remove the lift of each event (see event_impact.py)
+    lifts = event_impact.lift(model.coef_, columns, Linear_test[event_lst].to_numpy(), event_lst)
+    y_pred = event_impact.without_events(y_pred_event, lifts)
 
 
     # Display metrics
-    print(f'Mean Squared Error: {mean_squared_error(y_test, y_pred)}')
-    print(f'R-squared: {r2_score(y_test, y_pred)}')
-    print(f'R-squared_event: {r2_score(y_test, y_pred_event)}')
+    metrics = {
+        'mse': mean_squared_error(y_test, y_pred),
+        'r2': r2_score(y_test, y_pred),
+        'r2_event': r2_score(y_test, y_pred_event),
+        'cv_score': model.best_score_,
+        'fit_intercept': model.best_params_['fit_intercept'],
+        'n_rows': len(y_train),
+    }
+    print(f'Mean Squared Error: {metrics["mse"]}')
+    print(f'R-squared: {metrics["r2"]}')
+    print(f'R-squared_event: {metrics["r2_event"]}')
 
-    # save residuals
-    plt.figure(figsize=(20, 6))
-    plt.scatter(Linear_test['date'], y_test - y_pred_event, color='red')
-    plt.axhline(y=0, color='black', linestyle='--')
-    plt.xlabel('Date')
-    plt.ylabel('Residuals')
-    plt.title('Residuals for 2023')
-    plt.savefig(OUTPUT_FOLDER + f'\img\{place}_residuals.png')
+    # Save the fitted model for predict.py and report.py
+    artifacts.save_model(place, columns, model.coef_, model.intercept_, event_lst, {
+        'fit_intercept': bool(metrics['fit_intercept']), 'cv_score': float(metrics['cv_score']),
+        'n_rows': metrics['n_rows'], 'first_date': Linear_train['date'].min(), 'last_date': Linear_train['date'].max()})
 
-    # save actual vs. predicted ridership with event effect and without event effect
-    plt.figure(figsize=(20, 6))
-    plt.plot(Linear_test['date'], y_test, label='Actual')
-    #plt.plot(Linear_test['date'], y_pred, label='Predicted', alpha=0.5, color='green')
-    plt.plot(Linear_test['date'], y_pred_event, label='Predicted_event', alpha=0.5, color='red')
-    plt.xlabel('Date')
-    plt.ylabel('Ridership')
-    plt.title(f'Ridership Regression for 2023 in {place} with and without event effect')
-    plt.legend()
-    plt.savefig(OUTPUT_FOLDER + f'\img\{place}_ridership.png')
+    # The plots and the Excel file are made from the saved model by the report stage (see report.py)
 
+    return metrics
 
 
-    # Calculate coefficients
-    coefficients = pd.DataFrame({'Feature': X_train.columns, 'Coefficient': grid_search.best_estimator_.coef_})
+class SharedInputs:
+    """
+    Inputs shared by every station (the feature store and the event list),
+    loaded once per run instead of once per station.
+    """
 
-    #coefficients = coefficients.sort_values('Coefficient', ascending=False)
-    
+    def __init__(self, store, event_list):
+        self.store = store
+        self.event_list = event_list
 
-    # Add predicted values to the dataframe, right next to the actual values
-    Linear_train['predicted_event'] = y_pred_event
-    Linear_train['predicted'] = y_pred
 
-    # Save the results to an Excel file
-    with pd.ExcelWriter(OUTPUT_FOLDER + f'\excel\{place}_analysis_results.xlsx', engine='xlsxwriter') as writer:
-        # Write the Linear_train dataframe to a sheet named 'Predictions'
-        Linear_train.to_excel(writer, sheet_name='Predictions', index=False)
+def load_shared_inputs():
+    # Read the shared data
+    event_list = json.load(open(r'event_list.json', 'r'))
+
+    # Temperature and event features of every date (see feature_store.py)
+    store = feature_store.load_store()
 
-        # Write the coefficients dataframe to a sheet named 'Coefficients'
-        coefficients.to_excel(writer, sheet_name='Coefficients', index=False)
+    return SharedInputs(store, event_list)
 
 
-def get_clean_data(raw_path, place_name):
+def get_clean_data(raw_path, place_name, shared=None):
     # Read the data
-    raw_data = pd.read_csv(raw_path)
-    temperature = pd.read_csv(DATA_FOLDER + '\\Event\\' + 'temperature.csv')
-    event_list = json.load(open(r'event_list.json', 'r'))
-    event_data = pd.read_csv(DATA_FOLDER + r'\Event\event.csv')[event_list[place_name] + ['date']]
-    #event_data = pd.read_csv(DATA_FOLDER + r'\Event\event.csv')[event_list['roosevelt'] + ['date']]
+    return clean_raw_data(pd.read_csv(raw_path), place_name, shared)
 
-    # preporcess the temperature data
-    temperature['DATE'] = pd.to_datetime(temperature['DATE'])
-    temperature['temperature'] = (temperature['TMAX'] + temperature['TMIN']) / 2
 
-    # preprocess the event data
-    event_data['date'] = pd.to_datetime(event_data['date'])
+def clean_raw_data(raw_data, place_name, shared=None):
+    """
+    Clean frame of a station from its raw rows (the columns of the SQL query)
+    """
+    if shared is None:
+        shared = load_shared_inputs()
+    event_lst = shared.event_list[place_name]
 
     # Check data format
     standard_col = ['YEAR', 'MONTH', 'SERVICE_DATE', 'SORT_ALL', 'BRANCH', 'STATION', 'RIDES'] 
@@ -161,13 +167,9 @@ def get_clean_data(raw_path, place_name):
     # group by date
     raw_data = raw_data.groupby('date').sum().reset_index()
 
-    # merge the temperature data
-    clean_data = raw_data.merge(temperature[['DATE', 'temperature', 'WT01', 'WT02', \
-                                            'WT03', 'WT04', 'WT05', 'WT06', 'WT08', 'WT09', 'WT10']], \
-                                left_on='date', right_on='DATE', how='left').drop(columns='DATE').fillna(0)
-    
-    # merge the event data
-    clean_data = clean_data.merge(event_data, on='date', how='left').fillna(0)
+    # add the temperature and event data of each date from the feature store
+    values = shared.store.frame(raw_data['date'], features.WEATHER_COLUMNS + event_lst)
+    clean_data = pd.concat([raw_data, values], axis=1)
 
     return clean_data
 
@@ -175,23 +177,310 @@ def get_clean_data(raw_path, place_name):
 
 
 
-def main(start_date, end_date, STATION_DICT):
-    # run the pull_data script
-    pull_data.main(f"'{start_date}'", f"'{end_date}'", STATION_DICT)
-    
-    # Read the data
-    event_list = json.load(open(r'event_list.json', 'r'))
-    file_list = os.listdir(DATA_FOLDER + '\\' + 'Raw')
-
-    for file in file_list:
-        if file.endswith('.csv'):
-            data_path = DATA_FOLDER + '\\' + 'Raw\\' + file
-            place = file.split('.csv')[0]
-            data = get_clean_data(data_path, place)
-            data.to_csv(DATA_FOLDER + '\\' + 'Clean\\' + f'{place}.csv', index=False)
+def run_station(file, shared):
+    """
+    Clean and analyse a single station. Any error is caught and reported in the
+    returned record so that one bad station does not stop the whole batch.
+    """
+    place = file.split('.csv')[0]
+    record = {'station': place, 'status': 'ok', 'error': None}
 
+    try:
+        with telemetry.profiled(place):
+            with telemetry.stage('clean', place) as clean_stage:
+                data_path = DATA_FOLDER + '\\' + 'Raw\\' + file
+                data = get_clean_data(data_path, place, shared)
+                data.to_csv(DATA_FOLDER + '\\' + 'Clean\\' + f'{place}.csv', index=False)
+                clean_stage.set(rows=len(data))
 
             print(f'Working on {place}')
-            event_lst = event_list[place]
-            analysis(data, place, event_lst)
+            time0 = time.perf_counter()
+            metrics = analysis(data, place, shared.event_list[place], shared.store)
             print(f'{place} is done')
+
+        record.update(metrics)
+        record['clean_seconds'] = clean_stage.seconds
+        record['analysis_seconds'] = time.perf_counter() - time0
+
+    except Exception as e:
+        traceback.print_exc()
+        print(f'{place} failed: {e!r}')
+        record['status'] = 'failed'
+        record['error'] = repr(e)
+
+    return record
+
+
+def run_batch(file_list, shared):
+    """
+    Clean every station and fit them all together in one stacked solve (see batch.py).
+    Plots and Excel files are not produced in this mode; the coefficients of
+    every station are saved to a single CSV file.
+    """
+    time0 = time.perf_counter()
+    datas = {}
+    records = []
+    for file in file_list:
+        place = file.split('.csv')[0]
+        try:
+            with telemetry.stage('clean', place) as stage:
+                data = get_clean_data(DATA_FOLDER + '\\' + 'Raw\\' + file, place, shared)
+                data.to_csv(DATA_FOLDER + '\\' + 'Clean\\' + f'{place}.csv', index=False)
+                stage.set(rows=len(data))
+            datas[place] = data
+        except Exception as e:
+            traceback.print_exc()
+            print(f'{place} failed: {e!r}')
+            records.append({'station': place, 'status': 'failed', 'error': repr(e)})
+    time1 = time.perf_counter()
+
+    import batch
+
+    print(f'Fitting {len(datas)} stations together')
+    with telemetry.stage('fit', stations=len(datas)):
+        results = batch.fit_stations(datas, shared) if datas else {}
+    time2 = time.perf_counter()
+
+    coefficients = []
+    for place, result in results.items():
+        metrics = {key: result[key] for key in ['mse', 'r2', 'r2_event', 'cv_score', 'fit_intercept', 'n_rows']}
+        records.append({'station': place, 'status': 'ok', 'error': None, **metrics,
+                        'clean_seconds': (time1 - time0) / len(datas),
+                        'analysis_seconds': (time2 - time1) / len(datas)})
+        coefficients.append(pd.DataFrame({'Station': place, 'Feature': result['columns'],
+                                          'Coefficient': result['coef']}))
+        artifacts.save_model(place, result['columns'], result['coef'], result['intercept'], shared.event_list[place], {
+            'fit_intercept': bool(result['fit_intercept']), 'cv_score': float(result['cv_score']),
+            'n_rows': result['n_rows'], 'first_date': datas[place]['date'].min(), 'last_date': datas[place]['date'].max()})
+
+    if coefficients:
+        pd.concat(coefficients).to_csv(OUTPUT_FOLDER + '\\' + 'batch_coefficients.csv', index=False)
+
+    return records
+
+
+def pull(start_date, end_date, STATION_DICT, use_cache=False, bulk=False, workers=1):
+    # The Oracle client is only loaded for a pull
+    import pull_data
+    with telemetry.run('pull', stations=len(STATION_DICT)):
+        pull_data.main(f"'{start_date}'", f"'{end_date}'", STATION_DICT, use_cache=use_cache, bulk=bulk, workers=workers)
+
+
+def raw_files(stations=None):
+    file_list = [file for file in os.listdir(DATA_FOLDER + '\\' + 'Raw') if file.endswith('.csv')]
+    if stations:
+        file_list = [file for file in file_list if file.split('.csv')[0] in stations]
+    return file_list
+
+
+def clean(stations=None):
+    """
+    Write the clean frame of every station in Data/Raw to Data/Clean.
+    """
+    shared = load_shared_inputs()
+    for file in raw_files(stations):
+        place = file.split('.csv')[0]
+        data = get_clean_data(DATA_FOLDER + '\\' + 'Raw\\' + file, place, shared)
+        data.to_csv(DATA_FOLDER + '\\' + 'Clean\\' + f'{place}.csv', index=False)
+        print(f'{place}: {len(data)} rows')
+
+
+def fit(n_jobs=1, mode='station', stations=None, profile=None, trace_memory=False):
+    """
+    Clean and analyse every station in Data/Raw, see main().
+    """
+    with telemetry.run('fit', trace_memory=trace_memory, profile=profile, mode=mode):
+        return fit_stations(n_jobs, mode, stations)
+
+
+def fit_stations(n_jobs=1, mode='station', stations=None):
+    # Read the data shared by every station once
+    shared = load_shared_inputs()
+    file_list = raw_files(stations)
+
+    time0 = time.perf_counter()
+    results = []
+    if mode == 'batch':
+        results = run_batch(file_list, shared)
+    elif n_jobs == 1:
+        for file in file_list:
+            results.append(run_station(file, shared))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(run_station, file, shared) for file in file_list]
+            for future in as_completed(futures):
+                results.append(future.result())
+
+    # Summary of the run, one row per station
+    summary = pd.DataFrame(results, columns=['station', 'status', 'mse', 'r2', 'r2_event', 'cv_score',
+                                             'fit_intercept', 'n_rows', 'clean_seconds', 'analysis_seconds', 'error'])
+    summary = summary.sort_values('station').reset_index(drop=True)
+    summary.to_csv(OUTPUT_FOLDER + '\\' + 'run_summary.csv', index=False)
+
+    print(summary.to_string(index=False))
+    print(f'{(summary["status"] == "ok").sum()} of {len(summary)} stations done '
+          f'in {time.perf_counter() - time0:.1f} seconds')
+
+    return summary
+
+
+def report(stations=None, plots=True, excel=True, summary=None, n_jobs=1):
+    """
+    Print the summary of the last run, write the coefficients of every saved
+    model to one CSV file and render the station reports (see report.py).
+    """
+    summary_path = OUTPUT_FOLDER + '\\' + 'run_summary.csv'
+    if os.path.exists(summary_path):
+        print(pd.read_csv(summary_path).to_string(index=False))
+
+    coefficients = []
+    for place in artifacts.saved_stations():
+        model = artifacts.load_model(place)
+        coefficients.append(pd.DataFrame({'Station': place, 'Feature': model.columns + ['intercept'],
+                                          'Coefficient': list(model.coef) + [model.intercept]}))
+    if coefficients:
+        pd.concat(coefficients).to_csv(OUTPUT_FOLDER + '\\' + 'model_coefficients.csv', index=False)
+        print(f'Saved the coefficients of {len(coefficients)} stations')
+
+    if plots or excel or summary:
+        import report as report_stage
+        with telemetry.run('report'):
+            report_stage.render(stations, plots=plots, excel=excel, summary=summary, n_jobs=n_jobs)
+
+
+def main(start_date, end_date, STATION_DICT, n_jobs=1, mode='station', use_cache=False, bulk=False,
+         profile=None, trace_memory=False):
+    """
+    Pull, clean and analyse every station in Data/Raw.
+
+    n_jobs is the number of worker processes used for the per-station analysis.
+    Use 1 to run in the current process, or None to use every available core.
+    mode='batch' fits all stations together in one stacked solve instead (see run_batch).
+    use_cache=True only pulls the dates missing from the local ride cache (see ride_cache.py).
+    bulk=True pulls every station with a single query (see pull_data.pull_data_bulk).
+    The stages of every station are logged to Output/logs (see telemetry.py);
+    profile=<station> runs that station under cProfile and trace_memory=True
+    adds the peak memory of each stage.
+    """
+    with telemetry.run('main', trace_memory=trace_memory, profile=profile, mode=mode):
+        # run the pull_data script
+        pull(start_date, end_date, STATION_DICT, use_cache=use_cache, bulk=bulk)
+
+        summary = fit(n_jobs=n_jobs, mode=mode)
+
+        # Plots and Excel files of the fitted stations (not in batch mode)
+        if mode != 'batch':
+            import report as report_stage
+            report_stage.render(summary.loc[summary['status'] == 'ok', 'station'].tolist(), n_jobs=n_jobs)
+
+    return summary
+
+
+def station_dict(values):
+    # 'addison=1420' or 'airport=890,930' -> {'addison': "'1420'", 'airport': "'890', '930'"}
+    STATION_DICT = {}
+    for value in values:
+        place, ids = value.split('=', 1)
+        STATION_DICT[place] = ", ".join(f"'{station_id.strip()}'" for station_id in ids.split(','))
+    return STATION_DICT
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Ridership event analysis')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    pull_parser = commands.add_parser('pull', help='pull the daily rides from the database to Data/Raw')
+    pull_parser.add_argument('--start', required=True, help="first service date, e.g. 01jan2019")
+    pull_parser.add_argument('--end', required=True, help="last service date, e.g. 31dec2023")
+    pull_parser.add_argument('--station', action='append', required=True, metavar='NAME=ID[,ID...]',
+                             help='station name and its station ids, can be repeated')
+    pull_parser.add_argument('--use-cache', action='store_true', help='only pull the dates missing from the ride cache')
+    pull_parser.add_argument('--bulk', action='store_true', help='pull every station with one query')
+    pull_parser.add_argument('--workers', type=int, default=1, help='number of concurrent database sessions')
+    pull_parser.add_argument('--hourly', action='store_true', help='pull the rides of each hour to Data/Hourly instead')
+
+    clean_parser = commands.add_parser('clean', help='write the clean station frames to Data/Clean')
+    clean_parser.add_argument('--station', action='append', help='only these stations (default: every file in Data/Raw)')
+
+    fit_parser = commands.add_parser('fit', help='clean and fit every station in Data/Raw')
+    fit_parser.add_argument('--station', action='append', help='only these stations (default: every file in Data/Raw)')
+    fit_parser.add_argument('--jobs', type=int, default=1, help='worker processes, 0 for every core')
+    fit_parser.add_argument('--mode', choices=['station', 'batch'], default='station')
+    fit_parser.add_argument('--profile', metavar='STATION', help='run this station under cProfile')
+    fit_parser.add_argument('--trace-memory', action='store_true', help='log the peak memory of every stage (slower)')
+    fit_parser.add_argument('--hourly', action='store_true', help='fit the hourly models from Data/Hourly instead')
+
+    report_parser = commands.add_parser('report', help='plots, Excel files and a summary of the saved models')
+    report_parser.add_argument('--station', action='append', help='only these stations (default: every saved model)')
+    report_parser.add_argument('--no-plots', action='store_true', help='do not render the plots')
+    report_parser.add_argument('--no-excel', action='store_true', help='do not write the Excel files')
+    report_parser.add_argument('--summary', choices=['parquet', 'csv'], help='write the predictions of every station to one file')
+    report_parser.add_argument('--jobs', type=int, default=1, help='worker processes, 0 for every core')
+
+    predict_parser = commands.add_parser('predict', help='predict ridership from the saved models')
+    predict_parser.add_argument('--station', action='append', help='only these stations (default: every saved model)')
+    predict_parser.add_argument('--start', required=True, help='first date, e.g. 2024-01-01')
+    predict_parser.add_argument('--end', help='last date (default: the start date)')
+    predict_parser.add_argument('--scenario', help='CSV file with a date column and the weather or event values to use')
+    predict_parser.add_argument('--output', help='CSV file to write the predictions to (default: print them)')
+    predict_parser.add_argument('--hourly', action='store_true', help='predict each hour from the hourly models')
+
+    backtest_parser = commands.add_parser('backtest', help='out-of-sample errors of the model over rolling cutoffs')
+    backtest_parser.add_argument('--station', action='append', help='only these stations (default: every file in Data/Raw)')
+    backtest_parser.add_argument('--initial', type=int, default=365, help='days of data before the first cutoff')
+    backtest_parser.add_argument('--step', type=int, default=28, help='days between cutoffs')
+    backtest_parser.add_argument('--horizon', type=int, default=28, help='days predicted after each cutoff')
+    backtest_parser.add_argument('--window', type=int, help='train on the last WINDOW days only (default: every day up to the cutoff)')
+    backtest_parser.add_argument('--around', type=int, default=1, help='days around an event counted as near the event')
+    backtest_parser.add_argument('--jobs', type=int, default=1, help='worker processes, 0 for every core')
+
+    args = parser.parse_args(argv)
+    if args.command == 'predict' and args.hourly and args.scenario:
+        # Scenario values are per date, the hourly models also need the start time of each event
+        parser.error('--scenario is not supported with --hourly')
+
+    return args
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+
+    if args.command == 'pull' and args.hourly:
+        import hourly
+        hourly.pull(args.start, args.end, station_dict(args.station))
+    elif args.command == 'pull':
+        pull(args.start, args.end, station_dict(args.station), use_cache=args.use_cache, bulk=args.bulk, workers=args.workers)
+    elif args.command == 'clean':
+        clean(args.station)
+    elif args.command == 'fit' and args.hourly:
+        import hourly
+        hourly.fit(args.station)
+    elif args.command == 'fit':
+        fit(n_jobs=args.jobs or None, mode=args.mode, stations=args.station, profile=args.profile,
+            trace_memory=args.trace_memory)
+    elif args.command == 'report':
+        report(args.station, plots=not args.no_plots, excel=not args.no_excel, summary=args.summary, n_jobs=args.jobs or None)
+    elif args.command == 'predict':
+        import predict
+        dates = pd.date_range(args.start, args.end or args.start)
+        scenario = pd.read_csv(args.scenario) if args.scenario else None
+        try:
+            if args.hourly:
+                import hourly
+                predictions = hourly.predict_stations(args.station, dates)
+            else:
+                predictions = predict.predict_stations(args.station, dates, scenario)
+        except ValueError as e:
+            sys.exit(f'predict: {e}')
+        if args.output:
+            predictions.to_csv(args.output, index=False)
+        else:
+            print(predictions.to_string(index=False))
+    elif args.command == 'backtest':
+        import backtest
+        backtest.backtest_stations(args.station, n_jobs=args.jobs or None, initial=args.initial, step=args.step,
+                                   horizon=args.horizon, window=args.window, around=args.around)
+
+
+if __name__ == '__main__':
+    cli(sys.argv[1:])
@@ -0,0 +1,444 @@
+"""
+Hourly ridership mode.
+
+The daily pipeline sums the entries of a service date. This module pulls the
+entries of each hour instead and models them against the hours before, during
+and after each event.
+
+Storage. Hourly rows are about 24 times as many as daily rows, so they are kept
+compact and split by month:
+
+    Data/Hourly/<YYYY-MM>/<station>.parquet
+
+Each file has the columns station (categorical), date, hour (int8) and rides
+(int32). A pull streams the query result and writes a month as soon as the
+rows of the next month arrive. A fit reads one month at a time, for every
+station, and adds the X'X / X'y statistics of its rows to the running
+statistics of each station (see solver.py). Memory therefore depends on the
+size of one month and the number of columns, not on the length of the history.
+
+Features. Each hourly row gets the daily features of its date (weather,
+calendar and the untimed event columns, from the feature store), one dummy per
+hour of day for weekdays and one per hour for weekends, and three columns for
+each event column that has a spec in event_features (e.g. the Wrigley Field
+games):
+
+    <column>_before   event value in the PRE_HOURS hours before the start
+    <column>_during   event value from the start to the end (start + duration)
+    <column>_after    event value in the POST_HOURS hours after the end
+
+The start times and durations come from Data/Event/event_sources.csv. An event
+without a start time cannot be placed in the day and is left out. An event
+without a duration lasts DEFAULT_DURATION hours. The models are saved to
+Data/Model/Hourly in the format of artifacts.py.
+
+The hourly query assumes nm45dayall has an hour column (HOUR_COLUMN), the
+clock hour of the entry, 0 to 23. Change HOUR_COLUMN if the column has another name.
+"""
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import artifacts
+import event_features
+import feature_store
+import features
+import final_script
+import pull_data
+import solver
+import telemetry
+
+PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+
+# Set the data folder path (update the path as needed)
+DATA_FOLDER = PATH + r'\Data'
+OUTPUT_FOLDER = PATH + r'\Output'
+HOURLY_FOLDER = DATA_FOLDER + r'\Hourly'
+HOURLY_MODEL_FOLDER = DATA_FOLDER + r'\Model\Hourly'
+
+# Hour of the entry in nm45dayall (assumed, see above)
+HOUR_COLUMN = 'nm.hour'
+
+HOURS = range(24)
+WEEKEND = [5, 6]
+
+PRE_HOURS = 2  # hours before the start counted as arrivals
+POST_HOURS = 2  # hours after the end counted as departures
+DEFAULT_DURATION = 3.0  # hours, for events without a duration
+WINDOWS = ['before', 'during', 'after']
+
+
+def hourly_query(station, start_date, end_date, STATION_DICT):
+    # Same joins as pull_data.station_query, grouped by hour as well
+    return f"""
+        SELECT d3.service_date, {HOUR_COLUMN} AS hour, SUM(nm.rides) AS rides
+        FROM nm45dayall nm
+        JOIN dim_daytype3 d3 ON nm.yyyymmdd = d3.dateid
+        JOIN entrances e ON nm.entrance_id = e.entrance_id
+        JOIN stations s ON e.station_id = s.station_id
+        WHERE d3.service_date BETWEEN {start_date} AND {end_date}
+        AND s.station_id IN ({STATION_DICT[station]})
+        GROUP BY d3.service_date, {HOUR_COLUMN}
+        ORDER BY d3.service_date, {HOUR_COLUMN}
+    """
+
+
+def compact(rows, station):
+    """
+    Hourly rows with the compact column types: station as a category, hour as int8 and rides as int32
+    """
+    columns = {column.upper(): column for column in rows.columns}
+    return pd.DataFrame({
+        'station': pd.Categorical([station] * len(rows), categories=[station]),
+        'date': pd.to_datetime(rows[columns.get('SERVICE_DATE', 'date')]).to_numpy(dtype='datetime64[ns]'),
+        'hour': rows[columns.get('HOUR', 'hour')].to_numpy(dtype=np.int8),
+        'rides': rows[columns.get('RIDES', 'rides')].to_numpy(dtype=np.int32),
+    })
+
+
+def empty():
+    return pd.DataFrame({'station': pd.Categorical([]), 'date': pd.Series([], dtype='datetime64[ns]'),
+                         'hour': pd.Series([], dtype=np.int8), 'rides': pd.Series([], dtype=np.int32)})
+
+
+def month_path(month, station):
+    return os.path.join(HOURLY_FOLDER, month, f'{station}.parquet')
+
+
+def write_month(station, month, rows):
+    # The pulled dates replace the stored ones, other dates of the month are kept
+    os.makedirs(os.path.join(HOURLY_FOLDER, month), exist_ok=True)
+    if os.path.exists(month_path(month, station)):
+        stored = pd.read_parquet(month_path(month, station))
+        rows = pd.concat([stored[~stored['date'].isin(rows['date'].unique())], rows], ignore_index=True)
+    rows = rows.sort_values(['date', 'hour']).reset_index(drop=True)
+    rows.to_parquet(month_path(month, station), index=False)
+
+
+class MonthSink:
+    """
+    Write the rows of a pull (ordered by date) to one file per month, holding
+    only the rows of the current month in memory (see pull_data.stream_query)
+    """
+
+    def __init__(self, station):
+        self.station = station
+        self.month = None
+        self.batches = []
+
+    def flush(self):
+        if self.batches:
+            write_month(self.station, self.month, pd.concat(self.batches, ignore_index=True))
+        self.batches = []
+
+    def write(self, batch):
+        batch = compact(batch, self.station)
+        months = batch['date'].dt.strftime('%Y-%m')
+        for month, rows in batch.groupby(months.to_numpy(), sort=True):
+            if month != self.month:
+                self.flush()
+                self.month = month
+            self.batches.append(rows)
+
+    def close(self, columns):
+        self.flush()
+
+    def discard(self):
+        # The months already written were complete, the current one is dropped
+        self.batches = []
+
+
+def pull_station(station, cursor, start_date, end_date, STATION_DICT, database_error=None):
+    """
+    Pull the hourly rides of a station to Data/Hourly.
+    database_error is the error class of the driver (cx_Oracle.DatabaseError by default).
+    """
+    database_error = database_error or pull_data.oracle().DatabaseError
+    with telemetry.stage('pull', station, hourly=True) as stage:
+        try:
+            n_rows, timings = pull_data.stream_query(
+                cursor, hourly_query(station, start_date, end_date, STATION_DICT), MonthSink(station))
+            stage.set(rows=n_rows, **timings)
+
+        except database_error as e:
+            print(f"Error executing the query: {e}")
+            stage.fail(e)
+
+
+def pull(start_date, end_date, STATION_DICT):
+    """
+    Pull the hourly rides of every station in STATION_DICT.
+    The pulled dates replace the stored ones, other dates are kept.
+    """
+    with telemetry.run('pull_hourly', stations=len(STATION_DICT)):
+        connection = pull_data.oracle().connect(user=pull_data.DB_USER, password=pull_data.DB_PASSWORD,
+                                                dsn=pull_data.oracle_dsn())
+        cursor = connection.cursor()
+        for station in STATION_DICT.keys():
+            pull_station(station, cursor, f"'{start_date}'", f"'{end_date}'", STATION_DICT)
+        cursor.close()
+        connection.close()
+
+
+def months(start_date=None, end_date=None):
+    """
+    Months stored in Data/Hourly, oldest first
+    """
+    if not os.path.exists(HOURLY_FOLDER):
+        return []
+    stored = sorted(month for month in os.listdir(HOURLY_FOLDER) if os.path.isdir(os.path.join(HOURLY_FOLDER, month)))
+    if start_date is not None:
+        stored = [month for month in stored if month >= pd.Timestamp(start_date).strftime('%Y-%m')]
+    if end_date is not None:
+        stored = [month for month in stored if month <= pd.Timestamp(end_date).strftime('%Y-%m')]
+    return stored
+
+
+def read_month(month, stations=None):
+    """
+    Hourly rows of every station (or of stations) in a month
+    """
+    folder = os.path.join(HOURLY_FOLDER, month)
+    files = sorted(file.split('.parquet')[0] for file in os.listdir(folder) if file.endswith('.parquet'))
+    files = [station for station in files if stations is None or station in stations]
+    if not files:
+        return empty()
+
+    chunk = pd.concat([pd.read_parquet(month_path(month, station)) for station in files], ignore_index=True)
+    chunk['station'] = pd.Categorical(chunk['station'].astype(str), categories=files)
+    return chunk
+
+
+def read_station(station, start_date=None, end_date=None):
+    # All the stored hours of one station, e.g. to plot it
+    chunks = [read_month(month, [station]) for month in months(start_date, end_date)]
+    return pd.concat(chunks, ignore_index=True) if chunks else empty()
+
+
+def timed_specs(event_lst, specs=None):
+    """
+    Specs of the event columns of a station that can be placed in the day
+    """
+    specs = event_features.SPECS if specs is None else specs
+    return [spec for spec in specs if spec['column'] in event_lst]
+
+
+def clock_hours(values):
+    # '19:05' -> 19.083, missing values stay NaN
+    parts = values.astype('string').str.split(':', expand=True).reindex(columns=[0, 1])
+    return pd.to_numeric(parts[0], errors='coerce') + pd.to_numeric(parts[1], errors='coerce').fillna(0) / 60
+
+
+def event_windows(events, specs):
+    """
+    Start and end of each event matched by specs, in hours since 1970-01-01.
+    One row per (spec column, event).
+    """
+    start = clock_hours(events['start_time']).to_numpy(dtype=float)
+    duration = clock_hours(events['duration']).fillna(DEFAULT_DURATION).to_numpy(dtype=float)
+    days = (events['date'] - pd.Timestamp('1970-01-01')).dt.days.to_numpy()
+
+    windows = []
+    for spec in specs:
+        matched = event_features.match(events, spec) & ~np.isnan(start)
+        begin = days[matched] * 24 + start[matched]
+        windows.append(pd.DataFrame({
+            'column': spec['column'],
+            'start': begin,
+            'end': begin + duration[matched],
+            'value': event_features.event_values(events, spec)[matched],
+        }))
+    if not windows:
+        return pd.DataFrame(columns=['column', 'start', 'end', 'value'])
+    return pd.concat(windows, ignore_index=True)
+
+
+def window_table(windows):
+    """
+    Value of each <column>_<window> feature by hour since 1970-01-01, only for the hours with an event
+    """
+    if not len(windows):
+        return pd.DataFrame(dtype=float)
+    start = np.floor(windows['start'].to_numpy(dtype=float)).astype(np.int64)
+    end = np.ceil(windows['end'].to_numpy(dtype=float)).astype(np.int64)
+    end = np.maximum(end, start + 1)
+    ranges = {'before': (start - PRE_HOURS, start), 'during': (start, end), 'after': (end, end + POST_HOURS)}
+
+    parts = []
+    for window, (first, last) in ranges.items():
+        # One row per hour covered by each event
+        length = last - first
+        offset = np.arange(length.sum()) - np.repeat(np.cumsum(length) - length, length)
+        parts.append(pd.DataFrame({
+            'hour': np.repeat(first, length) + offset,
+            'feature': np.repeat((windows['column'] + '_' + window).to_numpy(), length),
+            'value': np.repeat(windows['value'].to_numpy(dtype=float), length),
+        }))
+    pairs = pd.concat(parts, ignore_index=True)
+    return pairs.pivot_table(index='hour', columns='feature', values='value', aggfunc='sum')
+
+
+def window_columns(specs):
+    return [f'{spec["column"]}_{window}' for spec in specs for window in WINDOWS]
+
+
+def hour_columns():
+    return [f'hour_{h}' for h in HOURS] + [f'hour_{h}_weekend' for h in HOURS]
+
+
+def hourly_columns(event_lst, specs):
+    """
+    Names of the columns of the hourly design matrix
+    """
+    timed = [spec['column'] for spec in specs]
+    daily_events = [column for column in event_lst if column not in timed]
+    return features.design_columns(daily_events) + hour_columns() + window_columns(specs)
+
+
+def build_hourly_matrix(rows, event_lst, store, table, specs):
+    """
+    Design matrix of the hourly rows of a station. table is the window_table
+    of the station's events. Returns a CSR matrix and its column names.
+    """
+    n = len(rows)
+    timed = [spec['column'] for spec in specs]
+    daily_events = [column for column in event_lst if column not in timed]
+
+    # Daily features of the date of each row
+    dates = pd.DatetimeIndex(rows['date'])
+    daily = store.frame(dates, features.WEATHER_COLUMNS + daily_events)
+    X_daily, _ = features.build_design_matrix(daily, daily_events, store.calendar_parts(dates))
+
+    # Hour of day, separately for weekends
+    hour = rows['hour'].to_numpy(dtype=int)
+    weekend = np.isin(dates.dayofweek, WEEKEND)
+    X_hour = sparse.csr_matrix((np.ones(n), (np.arange(n), hour + len(HOURS) * weekend)), shape=(n, 2 * len(HOURS)))
+
+    # Event values in the hours around each event
+    hours_since = (dates - pd.Timestamp('1970-01-01')).days.to_numpy() * 24 + hour
+    columns = window_columns(specs)
+    X_window = sparse.csr_matrix(table.reindex(index=hours_since, columns=columns).fillna(0).to_numpy(dtype=float))
+
+    return sparse.hstack([X_daily, X_hour, X_window], format='csr'), hourly_columns(event_lst, specs)
+
+
+def load_events():
+    # Long-format events with their start times, if the table exists
+    if os.path.exists(event_features.SOURCE_PATH):
+        return event_features.load_events()
+    return pd.DataFrame(columns=event_features.SOURCE_COLUMNS).astype({'date': 'datetime64[ns]'})
+
+
+def station_tables(places, event_list, events):
+    """
+    Timed specs and window table of every station
+    """
+    tables = {}
+    for place in places:
+        specs = timed_specs(event_list[place])
+        tables[place] = (specs, window_table(event_windows(events, specs)))
+    return tables
+
+
+def fit(stations=None, start_date=None, end_date=None, fit_intercept=True):
+    """
+    Fit the hourly model of every station in Data/Hourly (or of stations),
+    reading one month at a time, and save the models to Data/Model/Hourly.
+    Returns a summary with one row per station.
+    """
+    with telemetry.run('fit_hourly'):
+        shared = final_script.load_shared_inputs()
+        events = load_events()
+        time0 = time.perf_counter()
+
+        stats, tables, periods = {}, {}, {}
+        for month in months(start_date, end_date):
+            with telemetry.stage('features', month=month) as stage:
+                chunk = read_month(month, stations)
+                if start_date is not None or end_date is not None:
+                    chunk = chunk[chunk['date'].between(pd.Timestamp(start_date or chunk['date'].min()),
+                                                        pd.Timestamp(end_date or chunk['date'].max()))]
+                for place, rows in chunk.groupby('station', observed=True, sort=False):
+                    if place not in tables:
+                        tables.update(station_tables([place], shared.event_list, events))
+                    specs, table = tables[place]
+                    X, _ = build_hourly_matrix(rows, shared.event_list[place], shared.store, table, specs)
+                    block = solver.NormalEquations.from_data(X, rows['rides'].to_numpy(dtype=float))
+                    stats[place] = block if place not in stats else stats[place] + block
+                    first, last = periods.get(place, (rows['date'].min(), rows['date'].max()))
+                    periods[place] = (min(first, rows['date'].min()), max(last, rows['date'].max()))
+                stage.set(rows=len(chunk))
+
+        results = []
+        for place in sorted(stats):
+            with telemetry.stage('fit', place, hourly=True) as stage:
+                specs, _ = tables[place]
+                coef, intercept = stats[place].solve(fit_intercept)
+                r2 = float(stats[place].r2(coef, intercept))
+                artifacts.save_model(place, hourly_columns(shared.event_list[place], specs), coef, intercept,
+                                     shared.event_list[place],
+                                     {'granularity': 'hourly', 'fit_intercept': fit_intercept, 'r2': r2,
+                                      'n_rows': stats[place].n, 'first_date': periods[place][0],
+                                      'last_date': periods[place][1], 'pre_hours': PRE_HOURS,
+                                      'post_hours': POST_HOURS}, folder=HOURLY_MODEL_FOLDER)
+                stage.set(rows=stats[place].n)
+            results.append({'station': place, 'n_rows': stats[place].n, 'r2': r2,
+                            'first_date': periods[place][0], 'last_date': periods[place][1]})
+
+        summary = pd.DataFrame(results, columns=['station', 'n_rows', 'r2', 'first_date', 'last_date'])
+        summary.to_csv(OUTPUT_FOLDER + '\\' + 'hourly_summary.csv', index=False)
+        print(summary.to_string(index=False))
+        print(f'{len(summary)} hourly models fitted in {time.perf_counter() - time0:.1f} seconds')
+
+    return summary
+
+
+def predict(place, dates, store=None, events=None):
+    """
+    Hourly predictions of a saved hourly model on dates, with the event effect
+    (predicted_event) and without it (predicted)
+    """
+    model = artifacts.load_model(place, folder=HOURLY_MODEL_FOLDER)
+    store = store if store is not None else feature_store.load_store()
+    events = events if events is not None else load_events()
+
+    dates = pd.DatetimeIndex(dates)
+    no_weather = store.weather_missing(dates)
+    if no_weather.any():
+        raise ValueError(f'No weather for {place} from {dates[no_weather].min():%Y-%m-%d}: temperature.csv covers '
+                         f'{store.meta["weather_start"]} to {store.meta["weather_end"]}')
+
+    rows = pd.DataFrame({'date': np.repeat(dates, len(HOURS)), 'hour': np.tile(np.arange(len(HOURS)), len(dates))})
+    specs = timed_specs(model.events)
+    table = window_table(event_windows(events, specs))
+    X, columns = build_hourly_matrix(rows, model.events, store, table, specs)
+    if columns != model.columns:
+        raise ValueError(f'The feature schema of {place} changed since it was fitted, fit the station again')
+
+    # Effect of the event columns (daily and hourly windows)
+    event_columns = [i for i, column in enumerate(columns)
+                     if column in model.events or column in window_columns(specs)]
+    rows['predicted_event'] = X @ model.coef + model.intercept
+    rows['predicted'] = rows['predicted_event'] - X[:, event_columns] @ model.coef[event_columns]
+    return rows
+
+
+def predict_stations(places, dates, store=None):
+    """
+    Hourly predictions of every station in places (None for every saved hourly model), one frame
+    """
+    places = places if places is not None else artifacts.saved_stations(HOURLY_MODEL_FOLDER)
+    store = store if store is not None else feature_store.load_store()
+    events = load_events()
+    frames = []
+    for place in places:
+        frame = predict(place, dates, store, events)
+        frame.insert(0, 'station', place)
+        frames.append(frame)
+    predictions = pd.concat(frames, ignore_index=True)
+    predictions['station'] = predictions['station'].astype('category')
+    return predictions
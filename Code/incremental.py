@@ -0,0 +1,168 @@
+"""
+Incremental daily model update.
+
+Instead of refitting every station from scratch, the sufficient statistics of
+each station's regression (X'X, X'y, column sums, y'y and the row count) are kept
+on disk in Data/Model. New service dates are folded in with a rank-k update,
+i.e. the statistics of the new rows are added to the stored ones, and the model
+is re-solved from the updated statistics.
+
+A full refit (with cross-validation of fit_intercept) is only done the first
+time a station is seen, or when its feature schema changes, for example when a
+new event column is added for the station in event_list.json. Edits to past
+rows of event.csv are not detected; delete the station's files in Data/Model to
+force a refit.
+
+The pulls go through the local ride cache (see ride_cache.py), so a refit uses
+every date the cache holds and not just the dates of the last pull. A refit on
+fewer rows than the stored statistics is refused, and the station keeps its
+previous model until its full history is pulled again.
+
+The first run of a station must cover its full history. For the daily job,
+pull only the new dates, e.g. main('01mar24', '01mar24', STATION_DICT).
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import artifacts
+import features
+import final_script
+import ride_cache
+import solver
+
+PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+
+# Set the data folder path (update the path as needed)
+DATA_FOLDER = PATH + r'\Data'
+MODEL_FOLDER = DATA_FOLDER + r'\Model'
+
+
+def stats_paths(place):
+    return (os.path.join(MODEL_FOLDER, f'{place}_stats.npz'),
+            os.path.join(MODEL_FOLDER, f'{place}_stats.json'))
+
+
+def save_stats(place, stats, schema):
+    os.makedirs(MODEL_FOLDER, exist_ok=True)
+    npz_path, json_path = stats_paths(place)
+    np.savez(npz_path, xtx=stats.xtx, xty=stats.xty, x_sum=stats.x_sum,
+             y_sum=stats.y_sum, yty=stats.yty, n=stats.n)
+    with open(json_path, 'w') as f:
+        json.dump(schema, f, indent=2)
+
+
+def load_stats(place):
+    """
+    Return (NormalEquations, schema) of a station, or None if it was never fitted.
+    """
+    npz_path, json_path = stats_paths(place)
+    if not (os.path.exists(npz_path) and os.path.exists(json_path)):
+        return None
+
+    arrays = np.load(npz_path)
+    stats = solver.NormalEquations(arrays['xtx'], arrays['xty'], arrays['x_sum'],
+                                   arrays['y_sum'][()], arrays['yty'][()], int(arrays['n']))
+    with open(json_path, 'r') as f:
+        schema = json.load(f)
+
+    return stats, schema
+
+
+def cached_history(place, shared):
+    """
+    Clean frame of every date of a station in the ride cache, or None if it has none.
+    """
+    state = ride_cache.load_state(place)
+    if state is None or not state['ranges']:
+        return None
+
+    ranges = ride_cache.covered_ranges(state)
+    return final_script.clean_raw_data(ride_cache.read(place, ranges[0][0], ranges[-1][1]), place, shared)
+
+
+def refit_station(data, place, event_lst):
+    """
+    Fit a station from scratch and store its statistics.
+    """
+    X, columns = features.build_design_matrix(data, event_lst)
+    model = solver.NormalEquationsCV(cv=5).fit(X, data['ridership'])
+
+    schema = {
+        'columns': columns,
+        'fit_intercept': bool(model.best_params_['fit_intercept']),
+        'last_date': data['date'].max().strftime('%Y-%m-%d'),
+    }
+    save_stats(place, model.stats_, schema)
+    artifacts.save_model(place, columns, model.coef_, model.intercept_, event_lst, {
+        'fit_intercept': schema['fit_intercept'], 'cv_score': float(model.best_score_),
+        'n_rows': model.stats_.n, 'first_date': data['date'].min(), 'last_date': data['date'].max()})
+
+    return {'columns': columns, 'coef': model.coef_, 'intercept': model.intercept_,
+            'fit_intercept': schema['fit_intercept'], 'n_rows': model.stats_.n, 'new_rows': len(data),
+            'refit': True}
+
+
+def update_station(data, place, event_lst, history=None):
+    """
+    Fold the rows of a clean station frame that are newer than the stored
+    statistics into them, or refit if there are none or the schema changed.
+    A refit uses the rows of data and of history, the station's full clean frame.
+    """
+    saved = load_stats(place)
+    refit = saved is None or saved[1]['columns'] != features.design_columns(event_lst)
+    if refit and history is not None:
+        data = pd.concat([history, data], ignore_index=True)
+
+    data = data.copy()
+    data['date'] = pd.to_datetime(data['date'])
+    data = data.fillna(0).sort_values('date').drop_duplicates('date', keep='last')
+
+    if refit:
+        # Never replace the statistics with a fit on a shorter history
+        if saved is not None and len(data) < saved[0].n:
+            raise ValueError(f'the feature schema changed but only {len(data)} dates are available to refit, '
+                             f'fewer than the {saved[0].n} of the stored model; pull the full history first')
+
+        print(f'Refitting {place} on {len(data)} dates')
+        return refit_station(data, place, event_lst)
+
+    stats, schema = saved
+    new = data[data['date'] > pd.Timestamp(schema['last_date'])]
+    if len(new):
+        X, _ = features.build_design_matrix(new, event_lst)
+        stats = stats + solver.NormalEquations.from_data(X, new['ridership'])
+        schema['last_date'] = new['date'].max().strftime('%Y-%m-%d')
+        save_stats(place, stats, schema)
+
+    coef, intercept = stats.solve(schema['fit_intercept'])
+    if len(new):
+        previous = artifacts.load_model(place).meta if os.path.exists(artifacts.model_paths(place)[1]) else {}
+        artifacts.save_model(place, schema['columns'], coef, intercept, event_lst, {
+            'fit_intercept': schema['fit_intercept'], 'cv_score': previous.get('cv_score'),
+            'n_rows': stats.n, 'first_date': previous.get('first_date'), 'last_date': schema['last_date']})
+
+    return {'columns': schema['columns'], 'coef': coef, 'intercept': intercept,
+            'fit_intercept': schema['fit_intercept'], 'n_rows': stats.n, 'new_rows': len(new),
+            'refit': False}
+
+
+def main(start_date, end_date, STATION_DICT):
+    # Pull only the requested dates, keeping the earlier ones in the ride cache
+    final_script.pull(start_date, end_date, STATION_DICT, use_cache=True)
+
+    shared = final_script.load_shared_inputs()
+    results = {}
+    for place in STATION_DICT.keys():
+        data = final_script.get_clean_data(DATA_FOLDER + '\\' + 'Raw\\' + f'{place}.csv', place, shared)
+        try:
+            results[place] = update_station(data, place, shared.event_list[place], cached_history(place, shared))
+        except ValueError as e:
+            print(f'{place} not updated: {e}')
+            continue
+        print(f'{place}: {results[place]["new_rows"]} new rows, {results[place]["n_rows"]} in total')
+
+    return results
@@ -0,0 +1,128 @@
+"""
+Fast extraction of the boxscore and schedule information from baseball-reference pages.
+
+A boxscore page is several hundred kB of tables, but only the scorebox block
+is needed. The block is cut out of the raw page with a plain string search and
+a div-depth scan, and only that fragment is parsed with BeautifulSoup. The
+scorebox_meta block is looked up once. On schedule pages, a SoupStrainer
+restricts the tree to the p.game elements.
+
+parse_pages() parses many (cached) pages at once and returns the typed
+dataframe written to <year>_scorebox.csv.
+"""
+
+import re
+
+import pandas as pd
+from bs4 import BeautifulSoup, SoupStrainer
+
+SCOREBOX_START = re.compile(rb'<div[^>]*\bclass="scorebox"')
+DIV_TAG = re.compile(rb'<div\b|</div\s*>')
+
+SCOREBOX_COLUMNS = ['TeamA', 'TeamB', 'Date', 'Time', 'Attendance', 'Venue', 'Duration']
+
+
+def scorebox_fragment(content):
+    """
+    The <div class="scorebox"> block of a page, or None if the page has none
+    """
+    if isinstance(content, str):
+        content = content.encode()
+
+    start = SCOREBOX_START.search(content)
+    if start is None:
+        return None
+
+    depth = 0
+    for tag in DIV_TAG.finditer(content, start.start()):
+        depth += -1 if tag.group().startswith(b'</') else 1
+        if depth == 0:
+            return content[start.start():tag.end()]
+
+    # Unclosed block, keep the rest of the page
+    return content[start.start():]
+
+
+def parse_scorebox(content):
+    """
+    Teams, date, start time, attendance, venue and duration of a boxscore page,
+    as the raw strings shown on the page. Returns None if there is no scorebox.
+    """
+    fragment = scorebox_fragment(content)
+    if fragment is None:
+        return None
+
+    scorebox = BeautifulSoup(fragment, 'html.parser').find('div', class_='scorebox')
+
+    # in the class of scorebox, find all the strong tags
+    strong_tags = scorebox.find_all('strong')
+    meta = [div.text.strip() for div in scorebox.find('div', class_='scorebox_meta').find_all('div')]
+
+    return {
+        "teama": strong_tags[0].text.strip(),
+        "teamb": strong_tags[1].text.strip(),
+        "date": meta[0],
+        "start_time": meta[1],
+        "attendance": meta[2],
+        "venue": meta[3],
+        "duration": meta[4]
+    }
+
+
+def parse_schedule(content, prefix):
+    """
+    Boxscore links of the Cubs and White Sox home games on a league schedule page
+    """
+    scorebox_url = []
+    games = BeautifulSoup(content, 'html.parser', parse_only=SoupStrainer('p', class_='game'))
+    for game in games.find_all('p', class_='game'):
+        # Find all <a> tags, assuming the second one is the team after '@'
+        a_tags = game.find_all('a')
+        if len(a_tags) > 1:
+            # The team after '@' is in the second <a> tag
+            team = a_tags[1].get_text().strip()
+
+            if team in ['Chicago Cubs', 'Chicago White Sox']:
+
+                # The 'Boxscore' link is in the last <a> tag
+                boxscore_link = a_tags[-1]['href'] if a_tags[-1].get_text() == 'Boxscore' else None
+
+                # Save the extracted information
+                scorebox_url.append((team, boxscore_link))
+
+    df = pd.DataFrame(scorebox_url, columns=['team', 'boxscore_link'])
+    df['boxscore_link'] = prefix + df['boxscore_link']
+
+    return df
+
+
+def parse_pages(pages, links=None):
+    """
+    Parse many boxscore pages into one dataframe with the columns of
+    <year>_scorebox.csv. pages is a list of page contents (None for pages that
+    could not be fetched), links the matching URLs. Pages that cannot be parsed are skipped.
+    """
+    links = links if links is not None else [None] * len(pages)
+    rows = []
+    for link, page in zip(links, pages):
+        scorebox = None
+        if page is not None:
+            try:
+                scorebox = parse_scorebox(page)
+            except (AttributeError, IndexError):
+                pass
+        if scorebox is None:
+            print(f"Failed to parse the scorebox {link}")
+            continue
+
+        rows.append([scorebox["teama"], scorebox["teamb"], scorebox["date"], scorebox["start_time"],
+                     scorebox["attendance"], scorebox["venue"], scorebox["duration"], link])
+
+    return pd.DataFrame(rows, columns=SCOREBOX_COLUMNS + ['link']).astype('string')
+
+
+def parse_cached(urls, cache):
+    """
+    Parse the boxscore pages of urls from a page cache (see scrape_async.PageCache)
+    """
+    return parse_pages([cache.get(url) for url in urls], urls)
@@ -0,0 +1,115 @@
+"""
+Prediction from the saved station models, without a database pull or a refit.
+
+    predict('addison', pd.date_range('2024-01-01', '2024-01-31'),
+            scenario=pd.DataFrame({'date': ['2024-01-05'], 'sport_game_attendence_fri': [38000]}))
+
+The weather and event values of each date are read from the feature store
+(see feature_store.py). The columns of scenario replace them on its dates,
+e.g. a forecast temperature or the expected attendance of an upcoming game.
+Values missing from both are 0, as for missing values in training, except the
+temperature: dates outside temperature.csv need a temperature in scenario,
+otherwise a ValueError is raised rather than predicting with 0 degrees.
+
+Models are loaded on first use and kept in memory (see artifacts.py), so
+repeated calls only build the design rows and take one matrix product.
+"""
+
+import numpy as np
+import pandas as pd
+
+import artifacts
+import event_impact
+import feature_store
+import features
+
+_STORE = None
+
+
+def default_store():
+    # Open the feature store on first use
+    global _STORE
+    if _STORE is None:
+        _STORE = feature_store.load_store()
+    return _STORE
+
+
+def input_frame(model, dates, scenario=None, store=None):
+    """
+    Weather and event values of the model on dates, with the scenario applied
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    inputs = features.WEATHER_COLUMNS + model.events
+    store = store if store is not None else default_store()
+
+    frame = pd.DataFrame(store.take(dates, inputs), columns=inputs)
+    frame.insert(0, 'date', dates)
+
+    # Dates without a temperature in the store, until the scenario gives one
+    missing = store.weather_missing(dates)
+
+    if scenario is not None:
+        scenario = scenario.copy()
+        scenario['date'] = pd.to_datetime(scenario['date'])
+        scenario = scenario.drop_duplicates('date', keep='last').set_index('date')
+        unknown = [column for column in scenario.columns if column not in inputs]
+        if unknown:
+            raise KeyError(f'{model.place} has no input columns {unknown}')
+
+        rows = scenario.index.get_indexer(dates)
+        found = rows >= 0
+        for column in scenario.columns:
+            values = scenario[column].to_numpy(dtype=float)[rows[found]]
+            keep = ~np.isnan(values)
+            frame.loc[np.flatnonzero(found)[keep], column] = values[keep]
+            if column == 'temperature':
+                missing[np.flatnonzero(found)[keep]] = False
+
+    if missing.any():
+        raise ValueError(f'No temperature for {model.place} on {missing.sum()} dates from {dates[missing].min():%Y-%m-%d}: '
+                         f'temperature.csv covers {store.meta["weather_start"]} to {store.meta["weather_end"]}, '
+                         f'pass a temperature column for these dates in scenario')
+
+    return frame
+
+
+def predict(place, dates, scenario=None, store=None, folder=None):
+    """
+    Predicted ridership of a station on dates, with and without the event effect,
+    and the lift of each event.
+    """
+    model = artifacts.load_model(place, folder)
+    frame = input_frame(model, dates, scenario, store)
+
+    X, columns = features.build_design_matrix(frame, model.events)
+    if columns != model.columns:
+        raise ValueError(f'The feature schema of {place} changed since it was saved, refit the station')
+
+    predicted_event = X @ model.coef + model.intercept
+    lifts = event_impact.lift(model.coef, model.columns, frame[model.events].to_numpy(), model.events)
+
+    result = pd.DataFrame({'date': frame['date'], 'predicted_event': predicted_event,
+                           'predicted': event_impact.without_events(predicted_event, lifts)})
+    for i, event in enumerate(model.events):
+        result[f'lift_{event}'] = lifts[:, i]
+
+    return result
+
+
+def predict_stations(places, dates, scenario=None, store=None, folder=None):
+    """
+    predict() for several stations, stacked with a station column
+    """
+    places = places if places is not None else artifacts.saved_stations(folder)
+    results = []
+    for place in places:
+        # Only the scenario columns this station was fitted with
+        station_scenario = None
+        if scenario is not None:
+            inputs = features.WEATHER_COLUMNS + artifacts.load_model(place, folder).events
+            station_scenario = scenario[['date'] + [column for column in scenario.columns if column in inputs]]
+        result = predict(place, dates, station_scenario, store, folder)
+        result.insert(0, 'station', place)
+        results.append(result[['station', 'date', 'predicted_event', 'predicted']])
+
+    return pd.concat(results, ignore_index=True)
@@ -1,8 +1,12 @@
 import pandas as pd
-import cx_Oracle
+import numpy as np
 import time
 import os
 import sys
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import ride_cache
+import telemetry
 sys.path.append(os.path.abspath(os.path.join(os.getcwd(), os.pardir)))
 
 
@@ -21,31 +25,87 @@ DB_PASSWORD = "planningadmin"  # Replace with your own password
 
 PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
 DATA_FOLDER = PATH + r'\Data'
-cx_Oracle.init_oracle_client(lib_dir= DATA_FOLDER + r'\instantclient_21_13')
 
+# Rows per round trip (cursor.arraysize) and rows prefetched with the execute call
+ARRAYSIZE = 5000
+PREFETCHROWS = 5000
 
+# Column types of the query results, other columns are inferred
+COLUMN_TYPES = {'YEAR': 'int64', 'MONTH': 'int64', 'SORT_ALL': 'int64', 'RIDES': 'int64'}
+DATE_COLUMNS = ['SERVICE_DATE']
 
+# Concurrent pulls: number of sessions, per-query timeout and retries with exponential backoff
+MAX_WORKERS = 4
+QUERY_TIMEOUT = 900  # seconds
+RETRIES = 3
+BACKOFF = 5  # seconds before the first retry, doubled after each attempt
 
-def main(START_TIME, END_TIME, STATION_DICT):
+_ORACLE = None
 
+
+def oracle():
+    """
+    The cx_Oracle module, imported and pointed at the Instant Client on first use,
+    so that importing this module does not need the Oracle client
+    """
+    global _ORACLE
+    if _ORACLE is None:
+        import cx_Oracle
+        cx_Oracle.init_oracle_client(lib_dir= DATA_FOLDER + r'\instantclient_21_13')
+        _ORACLE = cx_Oracle
+    return _ORACLE
+
+
+def oracle_dsn():
     # Define your Oracle connection details
-    db_user = DB_USER
-    db_password = DB_PASSWORD
     db_host = "10.48.69.67"
     db_port = "1521"
     db_service_name = "cpc2ds"
 
     # Construct the connection string
-    dsn = cx_Oracle.makedsn(db_host, db_port, service_name=db_service_name)
+    return oracle().makedsn(db_host, db_port, service_name=db_service_name)
+
+
+def oracle_pool(max_workers=MAX_WORKERS):
+    """
+    Session pool with one session per worker
+    """
+    return oracle().SessionPool(user=DB_USER, password=DB_PASSWORD, dsn=oracle_dsn(),
+                                min=1, max=max_workers, increment=1, threaded=True)
+
+
+def main(START_TIME, END_TIME, STATION_DICT, use_cache=False, bulk=False, workers=1):
+    """
+    Pull every station in STATION_DICT to Data/Raw.
+
+    With use_cache=True only the dates missing from the local ride cache
+    (see ride_cache.py) are queried, and Data/Raw is written from the cache.
+    With bulk=True all stations are pulled with a single query (see pull_data_bulk).
+    With workers > 1 the stations are pulled concurrently from a session pool (see pull_concurrent).
+    """
+
+    if workers > 1 and not bulk:
+        pool = oracle_pool(workers)
+        try:
+            pull_concurrent(pool, START_TIME, END_TIME, STATION_DICT, use_cache=use_cache, workers=workers)
+        finally:
+            pool.close()
+        return
 
     # Establish the connection
-    connection = cx_Oracle.connect(user=db_user, password=db_password, dsn=dsn)
+    connection = oracle().connect(user=DB_USER, password=DB_PASSWORD, dsn=oracle_dsn())
 
     # Create a cursor
     cursor = connection.cursor()
     # Pull data for each station
-    for station in STATION_DICT.keys():
-        pull_data(station, cursor, start_date = START_TIME, end_date = END_TIME, STATION_DICT = STATION_DICT)
+    if bulk:
+        pull_data_bulk(cursor, START_TIME, END_TIME, STATION_DICT, use_cache=use_cache)
+    else:
+        for station in STATION_DICT.keys():
+            if use_cache:
+                pull_data_cached(station, cursor, start_date = START_TIME, end_date = END_TIME, STATION_DICT = STATION_DICT)
+            else:
+                pull_data(station, cursor, start_date = START_TIME, end_date = END_TIME, STATION_DICT = STATION_DICT)
 
     # Close the cursor and connection
     cursor.close()
@@ -53,13 +113,9 @@ def main(START_TIME, END_TIME, STATION_DICT):
 
 
 
-def pull_data(station, cursor, start_date, end_date, STATION_DICT):
-    """
-    Pull data from the Oracle database
-    """
-
+def station_query(station, start_date, end_date, STATION_DICT):
     # Define the SQL query
-    sql_query = f"""
+    return f"""
         SELECT d3.year, d3.month, d3.service_date, s.sort_all, b.pubreportname AS Branch, s.name AS Station,
             SUM(nm.rides) AS rides
         FROM nm45dayall nm
@@ -73,27 +129,425 @@ def pull_data(station, cursor, start_date, end_date, STATION_DICT):
         ORDER BY d3.year, d3.month, d3.service_date, s.sort_all
     """
 
+
+def rows_to_frame(rows, columns):
+    """
+    Convert a batch of fetched rows into a dataframe, one typed array per column
+    """
+    data = {}
+    for column, values in zip(columns, zip(*rows)):
+        if column.upper() in DATE_COLUMNS:
+            data[column] = pd.to_datetime(values)
+            continue
+        try:
+            data[column] = np.asarray(values, dtype=COLUMN_TYPES.get(column.upper(), None))
+        except (TypeError, ValueError):
+            # e.g. NULLs in a numeric column
+            data[column] = pd.Series(values)
+
+    return pd.DataFrame(data, columns=columns)
+
+
+class CsvSink:
+    """
+    Append batches to a CSV file, writing the header with the first batch.
+    The rows go to <path>.tmp, which replaces the file only once the query is
+    complete, so a failed query keeps the previous file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path + '.tmp', 'w', newline='')
+        self.header = True
+
+    def write(self, batch):
+        batch.to_csv(self.file, header=self.header, index=False)
+        self.header = False
+
+    def close(self, columns):
+        if self.header:
+            pd.DataFrame(columns=columns).to_csv(self.file, index=False)
+        self.file.close()
+        os.replace(self.path + '.tmp', self.path)
+
+    def discard(self):
+        self.file.close()
+        os.remove(self.path + '.tmp')
+
+
+class FrameSink:
+    """
+    Collect batches into a single dataframe (self.frame after close)
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.frame = None
+
+    def write(self, batch):
+        self.batches.append(batch)
+
+    def close(self, columns):
+        self.frame = pd.concat(self.batches, ignore_index=True) if self.batches else pd.DataFrame(columns=columns)
+
+    def discard(self):
+        self.batches = []
+
+
+class SplitSink:
+    """
+    Route the rows of each batch to one sink per station, by the STATION_GROUP column
+    """
+
+    def __init__(self, sinks, key='STATION_GROUP'):
+        self.sinks = sinks
+        self.key = key
+
+    def write(self, batch):
+        for station, rows in batch.groupby(self.key, sort=False):
+            self.sinks[station].write(rows.drop(columns=self.key).reset_index(drop=True))
+
+    def close(self, columns):
+        for sink in self.sinks.values():
+            sink.close([col for col in columns if col != self.key])
+
+    def discard(self):
+        for sink in self.sinks.values():
+            sink.discard()
+
+
+def stream_query(cursor, sql_query, sink, binds=None, arraysize=None, prefetchrows=None):
+    """
+    Execute a query and stream the result into sink in batches of arraysize rows
+    (ARRAYSIZE by default), so only one batch is held in memory at a time. Works with any DB-API cursor
+    (prefetchrows is only set where the driver supports it, e.g. cx_Oracle 8+).
+    The sink is closed when every row was fetched, and discarded if the query fails.
+
+    Returns the number of rows and the time spent in each phase.
+    """
+    arraysize = arraysize or ARRAYSIZE
+    prefetchrows = prefetchrows or PREFETCHROWS
+    timings = {'execute': 0.0, 'fetch': 0.0, 'convert': 0.0, 'write': 0.0}
+    cursor.arraysize = arraysize
+    if hasattr(cursor, 'prefetchrows'):
+        cursor.prefetchrows = prefetchrows
+
+    n_rows = 0
+    complete = False
     try:
-        # Execute the query
-        cursor.execute(sql_query)
+        time0 = time.perf_counter()
+        cursor.execute(sql_query, binds or {})
+        timings['execute'] += time.perf_counter() - time0
+        columns = [col[0] for col in cursor.description]
+
+        while True:
+            time0 = time.perf_counter()
+            rows = cursor.fetchmany(arraysize)
+            time1 = time.perf_counter()
+            timings['fetch'] += time1 - time0
+            if not rows:
+                break
+
+            batch = rows_to_frame(rows, columns)
+            time2 = time.perf_counter()
+            timings['convert'] += time2 - time1
+
+            sink.write(batch)
+            timings['write'] += time.perf_counter() - time2
+            n_rows += len(rows)
+        complete = True
+    finally:
+        time0 = time.perf_counter()
+        if complete:
+            sink.close(columns)
+        else:
+            sink.discard()
+        timings['write'] += time.perf_counter() - time0
+
+    print(f"{n_rows} rows: " + ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in timings.items()))
+
+    return n_rows, timings
+
+
+def query_station(station, cursor, start_date, end_date, STATION_DICT):
+    """
+    Run the daily rides query of a station and return the rows as a dataframe
+    """
+    sink = FrameSink()
+    stream_query(cursor, station_query(station, start_date, end_date, STATION_DICT), sink)
 
-        # Fetch all rows
-        result_rows = cursor.fetchall()
+    return sink.frame
 
-        # save the results to a dataframe
-        time0 = time.time()
-        df = pd.DataFrame(result_rows, columns=[col[0] for col in cursor.description])
-        time1 = time.time()
-        print(f"Time to fetch the data: {time1 - time0} seconds")
-        df.to_csv(DATA_FOLDER + r'/Raw' + f'/{station}.csv', index=False)
 
+def pull_data(station, cursor, start_date, end_date, STATION_DICT, database_error=None):
+    """
+    Pull data from the Oracle database.
+    database_error is the error class of the driver (cx_Oracle.DatabaseError by default).
+    """
+    database_error = database_error or oracle().DatabaseError
 
-    except cx_Oracle.DatabaseError as e:
-        print(f"Error executing the query: {e}")
+    with telemetry.stage('pull', station) as stage:
+        try:
+            sink = CsvSink(DATA_FOLDER + r'/Raw' + f'/{station}.csv')
+            n_rows, timings = stream_query(cursor, station_query(station, start_date, end_date, STATION_DICT), sink)
+            stage.set(rows=n_rows, **timings)
+
+
+        except database_error as e:
+            print(f"Error executing the query: {e}")
+            stage.fail(e)
+
+
+def update_cache(station, cursor, start_date, end_date, STATION_DICT):
+    """
+    Pull the dates of a station missing from the local ride cache into the cache.
+    Returns the number of rows pulled.
+    """
+    start, end = ride_cache.parse_date(start_date), ride_cache.parse_date(end_date)
+    n_rows = 0
+    for missing_start, missing_end in ride_cache.missing_ranges(station, STATION_DICT[station], start, end):
+        print(f"Pulling {station} from {missing_start.date()} to {missing_end.date()}")
+        df = query_station(station, cursor, ride_cache.oracle_date(missing_start),
+                           ride_cache.oracle_date(missing_end), STATION_DICT)
+        ride_cache.merge(station, STATION_DICT[station], df, missing_start, missing_end)
+        n_rows += len(df)
+
+    return n_rows
+
+
+def write_from_cache(station, start_date, end_date):
+    start, end = ride_cache.parse_date(start_date), ride_cache.parse_date(end_date)
+    ride_cache.read(station, start, end).to_csv(DATA_FOLDER + r'/Raw' + f'/{station}.csv', index=False)
+
+
+def pull_data_cached(station, cursor, start_date, end_date, STATION_DICT, database_error=None):
+    """
+    Pull only the dates missing from the local ride cache, then write the raw file from the cache.
+    If the pull fails, the raw file is left as it was.
+    """
+    database_error = database_error or oracle().DatabaseError
+    with telemetry.stage('pull', station, cached=True) as stage:
+        try:
+            stage.set(rows=update_cache(station, cursor, start_date, end_date, STATION_DICT))
+            write_from_cache(station, start_date, end_date)
+
+        except database_error as e:
+            print(f"Error executing the query: {e}")
+            stage.fail(e)
+
+
+class ConnectionPool:
+    """
+    Minimal pool with the acquire/release interface of cx_Oracle.SessionPool,
+    built on any DB-API connect() function, e.g. a local stand-in database.
+    """
+
+    def __init__(self, connect, size=MAX_WORKERS):
+        self.connect = connect
+        self.idle = queue.LifoQueue()
+        self.slots = queue.Queue()
+        for _ in range(size):
+            self.slots.put(None)
+
+    def acquire(self):
+        self.slots.get()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self.connect()
+        except Exception:
+            # Give the slot back, no connection holds it
+            self.slots.put(None)
+            raise
+
+    def release(self, connection):
+        self.idle.put(connection)
+        self.slots.put(None)
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+
+def pull_with_retry(pool, station, start_date, end_date, STATION_DICT, use_cache=False, database_error=None):
+    """
+    Pull one station on a pooled connection, retrying failed connections and
+    queries with exponential backoff.
 
+    QUERY_TIMEOUT is applied through the driver's call timeout where it has one
+    (cx_Oracle's connection.callTimeout). Errors are recorded in the returned
+    record instead of raised, so one station does not stop the others.
+    """
+    database_error = database_error or oracle().DatabaseError
+    time0 = time.perf_counter()
+    record = {'station': station, 'status': 'ok', 'attempts': 0, 'rows': None, 'error': None}
+
+    for attempt in range(RETRIES + 1):
+        record['attempts'] = attempt + 1
+        connection = None
+        try:
+            connection = pool.acquire()
+            if hasattr(connection, 'callTimeout'):
+                connection.callTimeout = int(QUERY_TIMEOUT * 1000)
+            cursor = connection.cursor()
+            try:
+                if use_cache:
+                    record['rows'] = update_cache(station, cursor, start_date, end_date, STATION_DICT)
+                else:
+                    sink = CsvSink(DATA_FOLDER + r'/Raw' + f'/{station}.csv')
+                    record['rows'], _ = stream_query(cursor, station_query(station, start_date, end_date, STATION_DICT), sink)
+            finally:
+                cursor.close()
+            if use_cache:
+                write_from_cache(station, start_date, end_date)
+            record['status'] = 'ok'
+            record['error'] = None
+            break
+
+        except database_error as e:
+            record['status'] = 'failed'
+            record['error'] = str(e)
+
+        except Exception as e:
+            # Not a database error, retrying would not help
+            record['status'] = 'failed'
+            record['error'] = repr(e)
+            print(f"Error pulling {station}: {e!r}")
+            break
+
+        finally:
+            if connection is not None:
+                pool.release(connection)
+
+        if attempt < RETRIES:
+            wait = BACKOFF * 2 ** attempt
+            print(f"Error pulling {station}: {record['error']}. Retrying in {wait} seconds")
+            time.sleep(wait)
+
+    record['seconds'] = time.perf_counter() - time0
+
+    # Log the pull of the station with all its attempts as one stage
+    telemetry.log({'event': 'stage', 'stage': 'pull', 'station': station, 'status': record['status'],
+                   'seconds': record['seconds'], 'rows': record['rows'], 'attempts': record['attempts'],
+                   'peak_rss_mb': telemetry.peak_rss_mb(), 'error': record['error']})
+    return record
+
+
+def pull_concurrent(pool, start_date, end_date, STATION_DICT, use_cache=False, workers=MAX_WORKERS, database_error=None):
+    """
+    Pull the stations concurrently, at most workers at a time, so a slow station
+    does not hold up the others. pool needs acquire() and release(connection),
+    e.g. oracle_pool() or a ConnectionPool.
+    """
+    time0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(pull_with_retry, pool, station, start_date, end_date, STATION_DICT,
+                                   use_cache, database_error) for station in STATION_DICT.keys()]
+        records = [future.result() for future in as_completed(futures)]
 
+    summary = pd.DataFrame(records).sort_values('station').reset_index(drop=True)
+    print(summary.to_string(index=False))
+    print(f"Pulled {(summary['status'] == 'ok').sum()} of {len(summary)} stations in {time.perf_counter() - time0:.1f} seconds")
 
+    return summary
 
 
+def station_ids(STATION_DICT, station):
+    # "'890', '930'" -> ['890', '930']
+    return [station_id.strip().strip("'") for station_id in STATION_DICT[station].split(',') if station_id.strip()]
+
+
+def bulk_sql(start_date, end_date, STATION_DICT):
+    """
+    Query of every station at once, with the bind variables of its station-group table.
 
+    The station ids are bind variables of an inline station-group table, so a
+    station id can belong to several stations.
+    """
+    binds = {}
+    groups = []
+    for station in STATION_DICT.keys():
+        for station_id in station_ids(STATION_DICT, station):
+            k = len(groups)
+            binds[f'id{k}'] = station_id
+            binds[f'grp{k}'] = station
+            groups.append(f"SELECT :id{k} AS station_id, :grp{k} AS station_group FROM dual")
+    group_table = "\n            UNION ALL ".join(groups)
+
+    # Define the SQL query
+    sql_query = f"""
+        SELECT grp.station_group AS STATION_GROUP, d3.year, d3.month, d3.service_date, s.sort_all, b.pubreportname AS Branch, s.name AS Station,
+            SUM(nm.rides) AS rides
+        FROM nm45dayall nm
+        JOIN dim_daytype3 d3 ON nm.yyyymmdd = d3.dateid
+        JOIN entrances e ON nm.entrance_id = e.entrance_id
+        JOIN stations s ON e.station_id = s.station_id
+        JOIN branches b ON s.branch_id = b.branch_id
+        JOIN (
+            {group_table}
+        ) grp ON s.station_id = grp.station_id
+        WHERE d3.service_date BETWEEN {start_date} AND {end_date}
+        GROUP BY grp.station_group, d3.year, d3.month, d3.service_date, s.sort_all, b.pubreportname, s.name
+        ORDER BY grp.station_group, d3.year, d3.month, d3.service_date, s.sort_all
+    """
+
+    return sql_query, binds
+
+
+def bulk_query(cursor, start_date, end_date, STATION_DICT):
+    """
+    Run the daily rides query of every station in one query and split the rows
+    per station on the client. Returns a dict of dataframes keyed by station.
+    """
+    sinks = {station: FrameSink() for station in STATION_DICT.keys()}
+    sql_query, binds = bulk_sql(start_date, end_date, STATION_DICT)
+    stream_query(cursor, sql_query, SplitSink(sinks), binds)
+
+    return {station: sink.frame for station, sink in sinks.items()}
+
+
+def pull_data_bulk(cursor, start_date, end_date, STATION_DICT, use_cache=False, database_error=None):
+    """
+    Pull every station with a single query instead of one query per station.
+
+    With use_cache=True, stations missing the same date range are pulled together,
+    so a cache that is up to date for every station needs one query for the new dates.
+    database_error is the error class of the driver (cx_Oracle.DatabaseError by default).
+    """
+    database_error = database_error or oracle().DatabaseError
+    start, end = ride_cache.parse_date(start_date), ride_cache.parse_date(end_date)
+
+    try:
+        if not use_cache:
+            sinks = {station: CsvSink(DATA_FOLDER + r'/Raw' + f'/{station}.csv') for station in STATION_DICT.keys()}
+            sql_query, binds = bulk_sql(start_date, end_date, STATION_DICT)
+            with telemetry.stage('pull', stations=len(STATION_DICT)) as stage:
+                n_rows, timings = stream_query(cursor, sql_query, SplitSink(sinks), binds)
+                stage.set(rows=n_rows, **timings)
+            return
+
+        # Group the stations by the date range they are missing
+        missing = {}
+        for station in STATION_DICT.keys():
+            for date_range in ride_cache.missing_ranges(station, STATION_DICT[station], start, end):
+                missing.setdefault(date_range, []).append(station)
+
+        for (missing_start, missing_end), stations in missing.items():
+            print(f"Pulling {len(stations)} stations from {missing_start.date()} to {missing_end.date()}")
+            subset = {station: STATION_DICT[station] for station in stations}
+            with telemetry.stage('pull', stations=len(stations)) as stage:
+                pulled = bulk_query(cursor, ride_cache.oracle_date(missing_start), ride_cache.oracle_date(missing_end), subset)
+                stage.set(rows=sum(len(df) for df in pulled.values()))
+            for station, df in pulled.items():
+                ride_cache.merge(station, STATION_DICT[station], df, missing_start, missing_end)
+
+    except database_error as e:
+        print(f"Error executing the query: {e}")
+        # Keep the raw files as they were
+        return
 
+    if use_cache:
+        for station in STATION_DICT.keys():
+            ride_cache.read(station, start, end).to_csv(DATA_FOLDER + r'/Raw' + f'/{station}.csv', index=False)
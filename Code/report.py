@@ -0,0 +1,163 @@
+"""
+Report stage: plots, Excel files and a compact summary of the fitted stations.
+
+The report is built from the saved results of the fit stage: the clean frame
+of the station (Data/Clean/<station>.csv) and its saved model (see artifacts.py).
+The predictions are recomputed from the coefficients, which takes a few
+milliseconds, so the fit stage does not render anything and a fit-only run over
+the whole network pays no rendering cost.
+
+For each station:
+
+    Output/img/<station>_residuals.png       residuals of the prediction with events
+    Output/img/<station>_ridership.png       actual vs. predicted ridership
+    Output/excel/<station>_analysis_results.xlsx   Predictions and Coefficients sheets
+
+plots=False or excel=False skip those outputs. summary='parquet' or 'csv' also
+writes the actual and predicted ridership of every station to one file,
+Output/predictions.<format>. Stations are rendered in parallel worker processes
+with the non-interactive Agg backend, and every figure is closed once saved.
+"""
+
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import artifacts
+import event_impact
+import features
+import telemetry
+
+PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+
+# Set the data folder path (update the path as needed)
+DATA_FOLDER = PATH + r'\Data'
+OUTPUT_FOLDER = PATH + r'\Output'
+
+
+def station_results(place):
+    """
+    Clean frame of a station with the predictions of its saved model added
+    """
+    model = artifacts.load_model(place)
+    data = pd.read_csv(DATA_FOLDER + '\\' + 'Clean\\' + f'{place}.csv')
+    data['date'] = pd.to_datetime(data['date'])
+    data = data.fillna(0)
+
+    X, columns = features.build_design_matrix(data, model.events)
+    if columns != model.columns:
+        raise ValueError(f'The feature schema of {place} changed since it was fitted, fit the station again')
+
+    # Add predicted values to the dataframe, right next to the actual values
+    data['predicted_event'] = X @ model.coef + model.intercept
+    lifts = event_impact.lift(model.coef, columns, data[model.events].to_numpy(), model.events)
+    data['predicted'] = event_impact.without_events(data['predicted_event'], lifts)
+
+    return model, data
+
+
+def save_plots(place, data):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    # save residuals
+    fig, ax = plt.subplots(figsize=(20, 6))
+    ax.scatter(data['date'], data['ridership'] - data['predicted_event'], color='red')
+    ax.axhline(y=0, color='black', linestyle='--')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Residuals')
+    ax.set_title('Residuals for 2023')
+    fig.savefig(OUTPUT_FOLDER + f'\\img\\{place}_residuals.png')
+    plt.close(fig)
+
+    # save actual vs. predicted ridership with event effect and without event effect
+    fig, ax = plt.subplots(figsize=(20, 6))
+    ax.plot(data['date'], data['ridership'], label='Actual')
+    ax.plot(data['date'], data['predicted_event'], label='Predicted_event', alpha=0.5, color='red')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Ridership')
+    ax.set_title(f'Ridership Regression for 2023 in {place} with and without event effect')
+    ax.legend()
+    fig.savefig(OUTPUT_FOLDER + f'\\img\\{place}_ridership.png')
+    plt.close(fig)
+
+
+def save_excel(place, model, data):
+    coefficients = pd.DataFrame({'Feature': model.columns, 'Coefficient': model.coef})
+
+    # Save the results to an Excel file
+    with pd.ExcelWriter(OUTPUT_FOLDER + f'\\excel\\{place}_analysis_results.xlsx', engine='xlsxwriter') as writer:
+        # Write the predictions to a sheet named 'Predictions'
+        data.to_excel(writer, sheet_name='Predictions', index=False)
+
+        # Write the coefficients dataframe to a sheet named 'Coefficients'
+        coefficients.to_excel(writer, sheet_name='Coefficients', index=False)
+
+
+def station_report(place, plots=True, excel=True, summary=False):
+    """
+    Render the report of one station. Returns a record with the timings, and
+    the predictions of the station if summary is set.
+    """
+    record = {'station': place, 'status': 'ok', 'error': None}
+    predictions = None
+    try:
+        with telemetry.stage('report', place) as stage:
+            model, data = station_results(place)
+            if plots:
+                save_plots(place, data)
+            if excel:
+                save_excel(place, model, data)
+            if summary:
+                predictions = data[['date', 'ridership', 'predicted_event', 'predicted']].copy()
+                predictions.insert(0, 'station', place)
+            stage.set(rows=len(data))
+        record['report_seconds'] = stage.seconds
+
+    except Exception as e:
+        traceback.print_exc()
+        print(f'Report of {place} failed: {e!r}')
+        record['status'] = 'failed'
+        record['error'] = repr(e)
+
+    return record, predictions
+
+
+def render(stations=None, plots=True, excel=True, summary=None, n_jobs=1):
+    """
+    Render the report of every station with a saved model (or of stations).
+
+    summary is None, 'parquet' or 'csv'. n_jobs is the number of worker
+    processes, None for every core.
+    """
+    stations = stations if stations is not None else artifacts.saved_stations()
+    time0 = time.perf_counter()
+
+    if n_jobs == 1:
+        outputs = [station_report(place, plots, excel, summary is not None) for place in stations]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            outputs = list(executor.map(station_report, stations, [plots] * len(stations),
+                                        [excel] * len(stations), [summary is not None] * len(stations)))
+
+    records = pd.DataFrame([record for record, _ in outputs], columns=['station', 'status', 'report_seconds', 'error'])
+
+    predictions = [frame for _, frame in outputs if frame is not None]
+    if summary is not None and predictions:
+        predictions = pd.concat(predictions, ignore_index=True)
+        predictions['station'] = predictions['station'].astype('category')
+        predictions[['predicted_event', 'predicted']] = predictions[['predicted_event', 'predicted']].astype(np.float32)
+        if summary == 'parquet':
+            predictions.to_parquet(OUTPUT_FOLDER + '\\' + 'predictions.parquet', index=False)
+        else:
+            predictions.to_csv(OUTPUT_FOLDER + '\\' + 'predictions.csv', index=False)
+
+    print(f'{(records["status"] == "ok").sum()} of {len(records)} reports done '
+          f'in {time.perf_counter() - time0:.1f} seconds')
+
+    return records
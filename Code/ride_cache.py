@@ -0,0 +1,158 @@
+"""
+Local columnar cache of the daily rides pulled from the database.
+
+Rows are stored as Parquet files partitioned by station and month:
+
+    Data/Cache/<station>/<YYYY-MM>.parquet
+
+Each station also keeps a small state file with the station ids it was pulled
+for and the date ranges already fetched, as a sorted list of disjoint
+[first, last] ranges. A pull then only queries the database for the dates not
+covered by those ranges, merges the new rows in, and writes
+Data/Raw/<station>.csv from the cache. If the station ids of a station change,
+its cache is discarded.
+"""
+
+import json
+import os
+import shutil
+
+import pandas as pd
+
+PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+
+# Set the data folder path (update the path as needed)
+DATA_FOLDER = PATH + r'\Data'
+CACHE_FOLDER = DATA_FOLDER + r'\Cache'
+
+KEY_COLUMNS = ['SERVICE_DATE', 'SORT_ALL']
+
+
+def parse_date(date):
+    """
+    Parse a date given as an Oracle literal such as "'01jan23'" or "'01jan2023'".
+    """
+    date = str(date).strip().strip("'")
+    for fmt in ['%d%b%Y', '%d%b%y']:
+        try:
+            return pd.to_datetime(date, format=fmt)
+        except ValueError:
+            pass
+    return pd.to_datetime(date)
+
+
+def oracle_date(date):
+    # Same literal format as start.ipynb
+    return "'" + pd.Timestamp(date).strftime('%d%b%Y').lower() + "'"
+
+
+def station_folder(station):
+    return os.path.join(CACHE_FOLDER, station)
+
+
+def load_state(station):
+    path = os.path.join(station_folder(station), '_state.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def covered_ranges(state):
+    """
+    Fetched date ranges of a state, oldest first
+    """
+    return [(pd.Timestamp(first), pd.Timestamp(last)) for first, last in state['ranges']]
+
+
+def add_range(ranges, first, last):
+    """
+    Add [first, last] to a list of date ranges, joining the ranges that overlap or touch
+    """
+    day = pd.Timedelta(days=1)
+    joined = []
+    for range_first, range_last in sorted(ranges + [(first, last)]):
+        if joined and range_first <= joined[-1][1] + day:
+            joined[-1] = (joined[-1][0], max(joined[-1][1], range_last))
+        else:
+            joined.append((range_first, range_last))
+    return joined
+
+
+def save_state(station, state):
+    with open(os.path.join(station_folder(station), '_state.json'), 'w') as f:
+        json.dump(state, f, indent=2)
+
+
+def missing_ranges(station, station_ids, start_date, end_date):
+    """
+    Date ranges between start_date and end_date that are not in the cache yet.
+    """
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    state = load_state(station)
+    if state is None or state['station_ids'] != station_ids:
+        return [(start_date, end_date)]
+
+    # Walk the fetched ranges and collect the gaps between start_date and end_date
+    day = pd.Timedelta(days=1)
+    ranges = []
+    first = start_date
+    for range_first, range_last in covered_ranges(state):
+        if range_last < first:
+            continue
+        if range_first > end_date:
+            break
+        if range_first > first:
+            ranges.append((first, range_first - day))
+        first = range_last + day
+    if first <= end_date:
+        ranges.append((first, end_date))
+
+    return ranges
+
+
+def merge(station, station_ids, data, start_date, end_date):
+    """
+    Merge the rows pulled for [start_date, end_date] into the cache.
+    """
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    state = load_state(station)
+    if state is not None and state['station_ids'] != station_ids:
+        shutil.rmtree(station_folder(station))
+        state = None
+    os.makedirs(station_folder(station), exist_ok=True)
+
+    data = data.copy()
+    data['SERVICE_DATE'] = pd.to_datetime(data['SERVICE_DATE'])
+    for month, rows in data.groupby(data['SERVICE_DATE'].dt.strftime('%Y-%m')):
+        path = os.path.join(station_folder(station), f'{month}.parquet')
+        if os.path.exists(path):
+            rows = pd.concat([pd.read_parquet(path), rows])
+        rows = rows.drop_duplicates(KEY_COLUMNS, keep='last').sort_values(KEY_COLUMNS)
+        rows.to_parquet(path, index=False)
+
+    # Dates after the last returned row may not be loaded in the database yet,
+    # so the fetched range only goes up to the data actually received
+    last = min(end_date, data['SERVICE_DATE'].max()) if len(data) else start_date - pd.Timedelta(days=1)
+    ranges = covered_ranges(state) if state is not None else []
+    if last >= start_date:
+        ranges = add_range(ranges, start_date, last)
+    state = {'station_ids': station_ids,
+             'ranges': [[first.strftime('%Y-%m-%d'), last.strftime('%Y-%m-%d')] for first, last in ranges]}
+    save_state(station, state)
+
+
+def read(station, start_date, end_date):
+    """
+    Cached rows of a station between start_date and end_date.
+    """
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    months = set(pd.period_range(start_date, end_date, freq='M').strftime('%Y-%m'))
+    folder = station_folder(station)
+    files = [os.path.join(folder, file) for file in sorted(os.listdir(folder))
+             if file.endswith('.parquet') and file.split('.parquet')[0] in months] if os.path.exists(folder) else []
+    if not files:
+        return pd.DataFrame(columns=['YEAR', 'MONTH', 'SERVICE_DATE', 'SORT_ALL', 'BRANCH', 'STATION', 'RIDES'])
+
+    data = pd.concat([pd.read_parquet(file) for file in files], ignore_index=True)
+    return data[data['SERVICE_DATE'].between(start_date, end_date)].reset_index(drop=True)
@@ -1,10 +1,9 @@
 import requests
-from bs4 import BeautifulSoup
 import time
 import pandas as pd
 import os
 import tqdm
-import clean_MLB
+import parse_boxscore
 
 BOXSCORE_PREFIX = 'https://www.baseball-reference.com/'
 # Print the current working directory's parent directory
@@ -40,66 +39,35 @@ def make_request(url):
 
 
 def get_each_game(url):
-    scorebox_url = []
     response = make_request(url)
     if response and response.status_code == 200:
-        # Create a soup object from the HTML
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        game_elements = soup.find_all('p', class_='game')
-        for game in game_elements:
-            # Find all <a> tags, assuming the second one is the team after '@'
-            a_tags = game.find_all('a')
-            if len(a_tags) > 1:
-                # The team after '@' is in the second <a> tag
-                team = a_tags[1].get_text().strip()
-
-                if team in ['Chicago Cubs', 'Chicago White Sox']:
-
-                    # The 'Boxscore' link is in the last <a> tag
-                    boxscore_link = a_tags[-1]['href'] if a_tags[-1].get_text() == 'Boxscore' else None
-
-                    # Save the extracted information
-                    scorebox_url.append((team, boxscore_link))
+        return parse_schedule(response.content)
 
     else:
         print("Failed to retrieve the page")
+        return parse_schedule(b'')
 
-    df = pd.DataFrame(scorebox_url, columns=['team', 'boxscore_link'])
-    df['boxscore_link'] = BOXSCORE_PREFIX + df['boxscore_link']
 
-    return df
+def parse_schedule(content, prefix=BOXSCORE_PREFIX):
+    """
+    Boxscore links of the Cubs and White Sox home games on a league schedule page
+    """
+    return parse_boxscore.parse_schedule(content, prefix)
 
 
 def get_scorebox(url):
     response = requests.get(url)
     if response.status_code == 200:
-        soup = BeautifulSoup(response.content, 'html.parser')
-        # in the class of scorebox, find all the strong tags
-        strong_tags = soup.find('div', class_='scorebox').find_all('strong')
-        teama = strong_tags[0].text.strip()
-        teamb = strong_tags[1].text.strip()
-
-        date = soup.find("div", class_="scorebox_meta").find_all("div")[0].text.strip()
-        start_time = soup.find("div", class_="scorebox_meta").find_all("div")[1].text.strip()
-        attendance = soup.find("div", class_="scorebox_meta").find_all("div")[2].text.strip()
-        venue = soup.find("div", class_="scorebox_meta").find_all("div")[3].text.strip()
-        duration = soup.find("div", class_="scorebox_meta").find_all("div")[4].text.strip()
-
-        return {
-            "teama": teama,
-            "teamb": teamb,
-            "date": date,
-            "start_time": start_time,
-            "attendance": attendance,
-            "venue": venue,
-            "duration": duration
-        }
+        return parse_scorebox(response.content)
     
     else:
         return None
 
 
+def parse_scorebox(content):
+    return parse_boxscore.parse_scorebox(content)
+
+
 def scrape_each_scorebox(url, year):
     # Create an empty list to store the extracted information
 
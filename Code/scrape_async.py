@@ -0,0 +1,220 @@
+"""
+Concurrent scraper for the MLB boxscores with rate limiting and an on-disk HTTP cache.
+
+Pages are fetched with asyncio, a bounded number at a time, and every request
+first takes a token from a token-bucket rate limiter. A 429 response empties the
+bucket until its Retry-After time has passed, so every request waits, not only
+the one that was refused.
+
+Fetched pages are kept in a content-addressed cache in Data/Event/http_cache:
+the body is stored under the SHA-256 of its content (objects/) and each URL
+points to it through a small ref file (refs/). Re-scrapes, and re-parses after
+the manual fixes, read from the cache and cost no network time. A boxscore
+does not change once the game is played, but the schedule page gains the new
+games during a season, so its cached copy expires after SCHEDULE_MAX_AGE.
+
+The pages are parsed with parse_boxscore, and the output file is the same
+<year>_scorebox.csv as scrape_MLB. Pass prefix (e.g. a local http.server
+serving saved pages) to scrape against a stand-in offline.
+"""
+
+import asyncio
+import email.utils
+import hashlib
+import os
+import time
+
+import requests
+
+import parse_boxscore
+import scrape_MLB
+
+PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+
+# Set the data folder path (update the path as needed)
+DATA_FOLDER = PATH + r'\Data'
+CACHE_FOLDER = DATA_FOLDER + r'\Event\http_cache'
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+}
+
+RATE = 0.5  # requests per second
+BURST = 2  # requests allowed at once after an idle period
+CONCURRENCY = 4
+MAX_ATTEMPTS = 5
+TIMEOUT = 30  # seconds
+RETRY_AFTER = 60  # seconds to pause after a 429 without a usable Retry-After header
+SCHEDULE_MAX_AGE = 24 * 3600  # seconds a cached schedule page is used before it is fetched again
+
+
+def retry_delay(value, default=RETRY_AFTER):
+    """
+    Seconds to wait from a Retry-After header, given either as seconds or as an HTTP date
+    """
+    if value is None:
+        return default
+    try:
+        return max(0, int(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    return max(0, when.timestamp() - time.time())
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: rate tokens per second, at most capacity stored
+    """
+
+    def __init__(self, rate=RATE, capacity=BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.updated - time.monotonic(), 0) + (1 - self.tokens) / self.rate
+                await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        # Empty the bucket and start refilling only after the given time
+        self.tokens = 0
+        self.updated = max(self.updated, time.monotonic() + seconds)
+
+
+class PageCache:
+    """
+    Content-addressed cache of fetched pages
+    """
+
+    def __init__(self, folder=None):
+        self.folder = folder or CACHE_FOLDER
+        os.makedirs(os.path.join(self.folder, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(self.folder, 'refs'), exist_ok=True)
+
+    def _ref_path(self, url):
+        return os.path.join(self.folder, 'refs', hashlib.sha256(url.encode()).hexdigest())
+
+    def get(self, url, max_age=None):
+        """
+        Cached content of url, or None if it is missing or older than max_age seconds
+        """
+        try:
+            if max_age is not None and time.time() - os.path.getmtime(self._ref_path(url)) > max_age:
+                return None
+            with open(self._ref_path(url), 'r') as f:
+                digest = f.read().strip()
+            with open(os.path.join(self.folder, 'objects', digest + '.html'), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, url, content):
+        digest = hashlib.sha256(content).hexdigest()
+        object_path = os.path.join(self.folder, 'objects', digest + '.html')
+        if not os.path.exists(object_path):
+            with open(object_path + '.tmp', 'wb') as f:
+                f.write(content)
+            os.replace(object_path + '.tmp', object_path)
+        with open(self._ref_path(url), 'w') as f:
+            f.write(digest)
+
+
+async def fetch(url, bucket, semaphore, cache, refresh=False, max_age=None):
+    """
+    Page content of url from the cache (if at most max_age seconds old), or from
+    the network under the rate limit. Returns None if the page cannot be retrieved.
+    """
+    if not refresh:
+        content = cache.get(url, max_age)
+        if content is not None:
+            return content
+
+    async with semaphore:
+        for _ in range(MAX_ATTEMPTS):
+            await bucket.acquire()
+            try:
+                response = await asyncio.to_thread(requests.get, url, headers=HEADERS, timeout=TIMEOUT)
+            except requests.exceptions.RequestException as e:
+                print(f"Request failed: {e}")
+                return None
+
+            if response.status_code == 200:
+                cache.put(url, response.content)
+                return response.content
+            elif response.status_code == 429:
+                # Respect the Retry-After header if available
+                retry_after = retry_delay(response.headers.get('Retry-After'))
+                print(f"Rate limit reached. Pausing all requests for {retry_after:.0f} seconds.")
+                bucket.pause(retry_after)
+            else:
+                print("Failed to retrieve the page, status code:", response.status_code)
+                return None
+
+    print(f"Giving up on {url}")
+    return None
+
+
+async def fetch_all(urls, rate=RATE, concurrency=CONCURRENCY, cache=None, refresh=False, max_age=None):
+    """
+    Fetch many pages concurrently. Returns the contents in the order of urls.
+    """
+    bucket = TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    cache = cache or PageCache()
+    return await asyncio.gather(*[fetch(url, bucket, semaphore, cache, refresh, max_age) for url in urls])
+
+
+async def scrape_season(url, prefix=scrape_MLB.BOXSCORE_PREFIX, rate=RATE, concurrency=CONCURRENCY, cache=None, refresh=False):
+    """
+    Scorebox information of the Cubs and White Sox home games on a schedule page
+    """
+    cache = cache or PageCache()
+    # The schedule gains games during the season, so an old copy is fetched again
+    schedule = (await fetch_all([url], rate, concurrency, cache, refresh, SCHEDULE_MAX_AGE))[0]
+    if schedule is None:
+        print("Failed to retrieve the page")
+    df = scrape_MLB.parse_schedule(schedule or b'', prefix)
+    print('Successfully get the game scorebox url')
+
+    scorebox_url = df['boxscore_link'].tolist()
+    pages = await fetch_all(scorebox_url, rate, concurrency, cache, refresh)
+
+    return parse_boxscore.parse_pages(pages, scorebox_url)
+
+
+def scrape_each_scorebox(url, year, **kwargs):
+    """
+    Same output as scrape_MLB.scrape_each_scorebox, fetched concurrently and through the cache
+    """
+    data_frame = asyncio.run(scrape_season(url, **kwargs))
+    data_frame.to_csv(DATA_FOLDER + '\\Event\\Baseball_in_wrigley_field' f'\\{year}_scorebox.csv', index=False)
+
+    return data_frame
+
+
+if __name__ == '__main__':
+    years = [2023, 2019, 2020, 2021, 2022]
+
+    for year in years:
+        url = f'https://www.baseball-reference.com/leagues/majors/{year}-schedule.shtml'
+        print(f"Scraping {year}...")
+        data = scrape_each_scorebox(url, year)
+        print(f"Scraping {year} complete")
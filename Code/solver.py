@@ -0,0 +1,196 @@
+"""
+Least-squares solver for the station regression, based on the normal equations.
+
+The sufficient statistics of a design matrix (X'X, X'y, the column sums, y'y and
+the row count) are computed once. Cross-validation folds are fitted by
+subtracting the held-out fold's statistics from the full ones, and the
+intercept is handled by centering the statistics, so the design matrix is never
+rebuilt or refitted.
+
+The solution is the minimum-norm least-squares solution, which is what
+sklearn's LinearRegression returns for the rank-deficient calendar dummies.
+"""
+
+import numpy as np
+
+# Eigenvalues of the column-scaled X'X below RCOND * largest eigenvalue are
+# treated as exact collinearity (e.g. the week and p2_week dummies)
+RCOND = 1e-10
+
+
+class NormalEquations:
+    """
+    Sufficient statistics of a linear regression.
+
+    y can hold several targets (one per column), in which case xty, y_sum and
+    yty have one entry per target.
+    """
+
+    def __init__(self, xtx, xty, x_sum, y_sum, yty, n):
+        self.xtx = xtx
+        self.xty = xty
+        self.x_sum = x_sum
+        self.y_sum = y_sum
+        self.yty = yty
+        self.n = n
+
+    @classmethod
+    def from_data(cls, X, y):
+        X = _as_2d_float(X)
+        y = np.asarray(y, dtype=float)
+        xtx = _to_dense(X.T @ X)
+        xty = _to_dense(X.T @ y)
+        x_sum = np.asarray(X.sum(axis=0), dtype=float).ravel()
+        return cls(xtx, xty, x_sum, y.sum(axis=0), (y * y).sum(axis=0), X.shape[0])
+
+    def __add__(self, other):
+        return NormalEquations(self.xtx + other.xtx, self.xty + other.xty, self.x_sum + other.x_sum,
+                               self.y_sum + other.y_sum, self.yty + other.yty, self.n + other.n)
+
+    def __sub__(self, other):
+        return NormalEquations(self.xtx - other.xtx, self.xty - other.xty, self.x_sum - other.x_sum,
+                               self.y_sum - other.y_sum, self.yty - other.yty, self.n - other.n)
+
+    def select(self, columns, target=None):
+        """
+        Statistics of a subset of the feature columns and, when y holds several
+        targets, of a single target. This is a block of X'X and X'y, so no data is touched.
+        """
+        columns = np.asarray(columns)
+        xty = self.xty[columns] if target is None else self.xty[columns, target]
+        y_sum = self.y_sum if target is None else self.y_sum[target]
+        yty = self.yty if target is None else self.yty[target]
+        return NormalEquations(self.xtx[np.ix_(columns, columns)], xty, self.x_sum[columns], y_sum, yty, self.n)
+
+    def solve(self, fit_intercept=True):
+        """
+        Return (coef, intercept) of the minimum-norm least-squares fit.
+        """
+        if fit_intercept:
+            x_mean = self.x_sum / self.n
+            y_mean = self.y_sum / self.n
+            xtx = self.xtx - self.n * np.outer(x_mean, x_mean)
+            xty = self.xty - self.n * np.multiply.outer(x_mean, y_mean)
+            coef = _min_norm_solve(xtx, xty)
+            intercept = y_mean - x_mean @ coef
+        else:
+            coef = _min_norm_solve(self.xtx, self.xty)
+            intercept = np.zeros_like(self.y_sum) if np.ndim(self.y_sum) else 0.0
+
+        return coef, intercept
+
+    def sse(self, coef, intercept):
+        """
+        Residual sum of squares of (coef, intercept) on the rows behind these statistics.
+        """
+        return (self.yty - 2 * np.sum(coef * self.xty, axis=0) - 2 * intercept * self.y_sum
+                + np.sum(coef * (self.xtx @ coef), axis=0) + 2 * intercept * (self.x_sum @ coef)
+                + self.n * intercept ** 2)
+
+    def r2(self, coef, intercept):
+        sst = self.yty - self.y_sum ** 2 / self.n
+        return 1 - self.sse(coef, intercept) / sst
+
+
+def kfold_slices(n, cv=5):
+    """
+    Contiguous, unshuffled folds with the same sizes as sklearn's KFold.
+    """
+    sizes = np.full(cv, n // cv)
+    sizes[:n % cv] += 1
+    stops = np.cumsum(sizes)
+    return [slice(stop - size, stop) for stop, size in zip(stops, sizes)]
+
+
+def cross_validate(full, folds, param_grid=(True, False)):
+    """
+    Pick fit_intercept by cross-validation using only sufficient statistics.
+
+    full is the NormalEquations of all rows and folds the NormalEquations of
+    each held-out fold. Returns the best fit_intercept and its mean R^2.
+    Ties go to the first option, as in GridSearchCV. Scores equal up to rounding
+    count as ties: with the day-of-week dummies both options describe the same
+    model, and only rounding noise would separate them.
+    """
+    scores = []
+    for fit_intercept in param_grid:
+        fold_scores = []
+        for fold in folds:
+            coef, intercept = (full - fold).solve(fit_intercept)
+            fold_scores.append(fold.r2(coef, intercept))
+        scores.append(np.mean(fold_scores, axis=0))
+
+    best = 0
+    for i, score in enumerate(scores):
+        if score > scores[best] and not np.isclose(score, scores[best], rtol=1e-9, atol=0):
+            best = i
+
+    return param_grid[best], scores[best]
+
+
+class NormalEquationsCV:
+    """
+    Drop-in replacement for GridSearchCV(LinearRegression(), {'fit_intercept': [True, False]}, cv=5).
+
+    Computes X'X and X'y once and fits every fold by downdating them. X can be a
+    dense array, a DataFrame or a scipy sparse matrix.
+    """
+
+    def __init__(self, cv=5):
+        self.cv = cv
+
+    def fit(self, X, y):
+        X = _as_2d_float(X)
+        y = np.asarray(y, dtype=float)
+
+        folds = [NormalEquations.from_data(X[rows], y[rows]) for rows in kfold_slices(X.shape[0], self.cv)]
+        full = folds[0]
+        for fold in folds[1:]:
+            full = full + fold
+
+        fit_intercept, self.best_score_ = cross_validate(full, folds)
+        self.best_params_ = {'fit_intercept': fit_intercept}
+        self.coef_, self.intercept_ = full.solve(fit_intercept)
+        self.stats_ = full
+
+        return self
+
+    def predict(self, X):
+        return _to_dense(_as_2d_float(X) @ self.coef_) + self.intercept_
+
+
+def _min_norm_solve(xtx, xty):
+    # Solve in column-scaled coordinates to find the null space reliably, then
+    # project the solution onto the row space in the original coordinates
+    diag = np.diag(xtx)
+    scale = np.zeros_like(diag)
+    scale[diag > 0] = 1 / np.sqrt(diag[diag > 0])
+
+    eigval, eigvec = np.linalg.eigh(xtx * np.outer(scale, scale))
+    keep = eigval > RCOND * max(eigval.max(), 0)
+
+    rhs = xty * (scale if xty.ndim == 1 else scale[:, None])
+    kept = eigvec[:, keep]
+    coef = kept @ ((kept.T @ rhs) / (eigval[keep] if xty.ndim == 1 else eigval[keep][:, None]))
+    coef = coef * (scale if xty.ndim == 1 else scale[:, None])
+
+    # Directions of the null space; columns that are all zero belong to it too
+    null = np.hstack([eigvec[:, ~keep] * scale[:, None], np.eye(len(diag))[:, diag <= 0]])
+    if null.shape[1]:
+        basis, singular, _ = np.linalg.svd(null, full_matrices=False)
+        basis = basis[:, singular > RCOND * singular.max()]
+        coef = coef - basis @ (basis.T @ coef)
+
+    return coef
+
+
+def _as_2d_float(X):
+    if hasattr(X, 'tocsr'):
+        return X.tocsr().astype(float)
+    return np.asarray(X, dtype=float)
+
+
+def _to_dense(a):
+    if hasattr(a, 'toarray'):
+        return a.toarray()
+    return np.asarray(a)
@@ -0,0 +1,230 @@
+"""
+Run telemetry: per-stage timers and a structured JSON-lines run log.
+
+Each stage of a station (pull, clean, features, fit, report) is wrapped in
+
+    with telemetry.stage('clean', place) as s:
+        ...
+        s.set(rows=len(data))
+
+which writes one line to Output/logs/<run_id>.jsonl when the stage ends:
+
+    {"run_id": ..., "time": ..., "pid": ..., "event": "stage", "stage": "clean",
+     "station": "addison", "status": "ok", "seconds": 0.12, "rows": 1826,
+     "peak_rss_mb": 210.5, "peak_traced_mb": null, "error": null}
+
+peak_rss_mb is the peak resident memory of the process so far. With
+trace_memory=True, peak_traced_mb is the peak memory allocated inside the stage,
+measured with tracemalloc (this slows the run down). With profile=<station>,
+the stages of that station are run under cProfile, and the stats are saved next
+to the log (<run_id>_<station>.prof and a text summary in .txt).
+
+A run is started with `with telemetry.run('fit'):`. The log settings are kept in
+an environment variable so worker processes write to the same log. Outside a
+run, stages are timed but nothing is written.
+"""
+
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+PATH = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+
+# Set the output folder path (update the path as needed)
+OUTPUT_FOLDER = PATH + r'\Output'
+LOG_FOLDER = OUTPUT_FOLDER + r'\logs'
+
+ENV_VAR = 'RIDERSHIP_RUN_LOG'
+
+_LOCK = threading.Lock()
+
+
+def current():
+    """
+    Settings of the active run (path, run_id, trace_memory, profile), or None
+    """
+    value = os.environ.get(ENV_VAR)
+    return json.loads(value) if value else None
+
+
+def peak_rss_mb():
+    # Peak resident memory of this process, where the platform reports it
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 2 ** 20
+    except ImportError:
+        return None
+
+
+def log(record):
+    """
+    Append a record to the log of the active run
+    """
+    settings = current()
+    if settings is None:
+        return
+    record = {'run_id': settings['run_id'], 'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'pid': os.getpid(), **record}
+    line = json.dumps(record, default=str) + '\n'
+    with _LOCK:
+        with open(settings['path'], 'a') as f:
+            f.write(line)
+
+
+def start_run(name, trace_memory=False, profile=None, folder=None, **fields):
+    """
+    Start a run log and return its path
+    """
+    folder = folder or LOG_FOLDER
+    os.makedirs(folder, exist_ok=True)
+    run_id = time.strftime('%Y%m%d_%H%M%S') + f'_{os.getpid()}'
+    settings = {'path': os.path.join(folder, f'{run_id}.jsonl'), 'run_id': run_id,
+                'trace_memory': trace_memory, 'profile': profile}
+    os.environ[ENV_VAR] = json.dumps(settings)
+    log({'event': 'start', 'name': name, **fields})
+    return settings['path']
+
+
+def end_run(seconds=None):
+    settings = current()
+    if settings is None:
+        return None
+    log({'event': 'end', 'seconds': seconds, 'peak_rss_mb': peak_rss_mb()})
+    del os.environ[ENV_VAR]
+    return settings['path']
+
+
+@contextlib.contextmanager
+def run(name, trace_memory=False, profile=None, **fields):
+    """
+    Log a run, unless one is already active (then its stages go to that log)
+    """
+    if current() is not None:
+        yield current()['path']
+        return
+
+    time0 = time.perf_counter()
+    path = start_run(name, trace_memory, profile, **fields)
+    try:
+        yield path
+    finally:
+        end_run(time.perf_counter() - time0)
+        summarize(path)
+        print(f'Run log saved to {path}')
+
+
+class Stage:
+    """
+    Fields of a stage record, set while the stage runs
+    """
+
+    def __init__(self, name, station, fields):
+        self.name = name
+        self.station = station
+        self.fields = fields
+        self.seconds = None
+        self.status = 'ok'
+        self.error = None
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def fail(self, error):
+        # Mark a stage as failed when the error is handled inside it
+        self.status = 'failed'
+        self.error = str(error)
+
+
+@contextlib.contextmanager
+def stage(name, station=None, **fields):
+    """
+    Time a stage and log it. Errors are logged and raised again.
+    """
+    settings = current()
+    tracing = bool(settings and settings['trace_memory']) and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+
+    record = Stage(name, station, {'rows': None, **fields})
+    time0 = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record.fail(repr(e))
+        raise
+    finally:
+        record.seconds = time.perf_counter() - time0
+        peak_traced = None
+        if tracing:
+            peak_traced = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        log({'event': 'stage', 'stage': name, 'station': station, 'status': record.status, 'seconds': record.seconds,
+             **record.fields, 'peak_rss_mb': peak_rss_mb(), 'peak_traced_mb': peak_traced, 'error': record.error})
+
+
+@contextlib.contextmanager
+def profiled(station):
+    """
+    Run the block under cProfile if station is the profiled station of the run
+    """
+    settings = current()
+    if settings is None or settings['profile'] != station:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        prof_path = settings['path'].replace('.jsonl', f'_{station}.prof')
+        profiler.dump_stats(prof_path)
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(40)
+        with open(prof_path.replace('.prof', '.txt'), 'w') as f:
+            f.write(text.getvalue())
+        log({'event': 'profile', 'station': station, 'path': prof_path})
+
+
+def load(path):
+    """
+    Stage records of a run log as a dataframe
+    """
+    with open(path, 'r') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    stages = pd.DataFrame([record for record in records if record.get('event') == 'stage'])
+    return stages
+
+
+def summarize(path, top=10):
+    """
+    Seconds per station and stage of a run, slowest stations first
+    """
+    stages = load(path)
+    if stages.empty:
+        return stages
+    stages['station'] = stages['station'].fillna('(all)')
+    table = stages.pivot_table(index='station', columns='stage', values='seconds', aggfunc='sum', fill_value=0)
+    table['total'] = table.sum(axis=1)
+    table = table.sort_values('total', ascending=False)
+
+    print(table.head(top).round(3).to_string())
+    print('Seconds per stage: ' + ', '.join(f'{stage} {seconds:.1f}' for stage, seconds in
+                                             table.drop(columns='total').sum().sort_values(ascending=False).items()))
+    return table
@@ -0,0 +1,74 @@
+"""
+Tests of clean_MLB on a small season in the format scrape_MLB writes.
+
+Run from the Code/ directory with `python -m pytest test_clean_MLB.py`.
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import clean_MLB
+import event_features
+
+
+@pytest.fixture
+def season(tmp_path, monkeypatch):
+    """
+    A scraped 2023 scorebox season in a temporary Data folder: a doubleheader,
+    day and night weekday games, a 12 p.m. start and a game at another venue
+    """
+    monkeypatch.setattr(clean_MLB, 'DATA_FOLDER', str(tmp_path / 'Data'))
+    monkeypatch.setattr(event_features, 'SOURCE_PATH', str(tmp_path / 'event_sources.csv'))
+
+    scorebox = pd.DataFrame({
+        'TeamA': 'Team A', 'TeamB': 'Chicago Cubs',
+        'Date': ['Friday, April 07, 2023', 'Saturday, April 08, 2023', 'Saturday, April 08, 2023',
+                 'Sunday, April 09, 2023', 'Monday, April 10, 2023', 'Tuesday, April 11, 2023'],
+        'Time': ['Start Time: 1:20 p.m. Local', 'Start Time: 12:05 p.m. Local', 'Start Time: 7:05 p.m. Local',
+                 'Start Time: 1:10 p.m. Local', 'Start Time: 1:20 p.m. Local', 'Start Time: 6:40 p.m. Local'],
+        'Attendance': ['Attendance: 35,112', 'Attendance: 30,001', 'Attendance: 38,250',
+                       'Attendance: 20,000', 'Attendance: 28,999', 'Attendance: 950'],
+        'Venue': ['Venue: Wrigley Field', 'Venue: Wrigley Field', 'Venue: Wrigley Field',
+                  'Venue: Guaranteed Rate Field', 'Venue: Wrigley Field', 'Venue: Wrigley Field'],
+        'Duration': ['Game Duration: 2:41', 'Game Duration: 3:02', 'Game Duration: 2:58',
+                     'Game Duration: 2:30', 'Game Duration: 2:45', 'Game Duration: 3:10'],
+        'link': [f'https://www.baseball-reference.com/boxes/CHN/CHN{day}.shtml'
+                 for day in ['202304070', '202304081', '202304082', '202304090', '202304100', '202304110']],
+    })
+    folder = clean_MLB.DATA_FOLDER + '\\Event\\Baseball_in_wrigley_field\\'
+    os.makedirs(folder)
+    scorebox.to_csv(folder + '2023_scorebox.csv', index=False)
+    return scorebox
+
+
+def test_clean_data(season):
+    data = clean_MLB.clean_data(season.copy())
+
+    assert data['Date'].tolist() == list(pd.to_datetime(['2023-04-07', '2023-04-08', '2023-04-08', '2023-04-09',
+                                                         '2023-04-10', '2023-04-11']))
+    assert data['Time'].tolist() == ['13:20', '12:05', '19:05', '13:10', '13:20', '18:40']
+    assert data['Attendance'].tolist() == [35112, 30001, 38250, 20000, 28999, 950]
+    assert data['Venue'].iloc[0] == 'Wrigley Field'
+    assert data['Duration'].iloc[0] == '2:41'
+
+
+def test_main_keeps_every_wrigley_game(season):
+    columns = clean_MLB.main().set_index('date')
+
+    # One row per Wrigley Field date, with the doubleheader summed
+    assert len(columns) == 4
+    assert columns.loc['2023-04-07', 'sport_game_attendence_fri'] == 35112
+    assert columns.loc['2023-04-08', 'sport_game_attendence_sat'] == 30001 + 38250
+    assert columns.loc['2023-04-10', 'sport_game_attendence_day_weekday(nofri)'] == 28999
+    assert columns.loc['2023-04-11', 'sport_game_attendence_night_weekday(nofri)'] == 950
+    assert columns.to_numpy().sum() == 35112 + 30001 + 38250 + 28999 + 950
+
+
+def test_main_records_every_game(season):
+    clean_MLB.main()
+
+    events = event_features.load_events()
+    assert len(events) == len(season)
+    assert (events['venue'] == 'Guaranteed Rate Field').sum() == 1